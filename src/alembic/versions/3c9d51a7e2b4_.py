@@ -0,0 +1,27 @@
+"""users email prefix search index
+
+Revision ID: 3c9d51a7e2b4
+Revises: 6e5a9efaf1f5
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c9d51a7e2b4'
+down_revision = '6e5a9efaf1f5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # built concurrently so a populated users table stays writable meanwhile
+    with op.get_context().autocommit_block():
+        op.create_index('users_email_lower_idx', 'users', [sa.text('lower(email) text_pattern_ops')], unique=False, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('users_email_lower_idx', table_name='users', postgresql_concurrently=True)
@@ -0,0 +1,42 @@
+"""notify users_changed on user updates and deletes
+
+Revision ID: 8d4f0b6c2a17
+Revises: 3c9d51a7e2b4
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '8d4f0b6c2a17'
+down_revision = '3c9d51a7e2b4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # workers drop their cached copy of the user, NOTIFY is sent on commit
+    op.execute("""
+        CREATE FUNCTION notify_users_changed() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('users_changed', OLD.id::text);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER users_updated AFTER UPDATE ON users
+        FOR EACH ROW WHEN (OLD.* IS DISTINCT FROM NEW.*)
+        EXECUTE FUNCTION notify_users_changed()
+    """)
+    op.execute("""
+        CREATE TRIGGER users_deleted AFTER DELETE ON users
+        FOR EACH ROW EXECUTE FUNCTION notify_users_changed()
+    """)
+
+
+def downgrade():
+    op.execute("DROP TRIGGER users_deleted ON users")
+    op.execute("DROP TRIGGER users_updated ON users")
+    op.execute("DROP FUNCTION notify_users_changed()")
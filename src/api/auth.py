@@ -13,18 +13,23 @@ from fastapi.security import OAuth2PasswordRequestForm
 from fastapi_sso.sso.google import GoogleSSO
 
 from settings import oauth2_scope
-from domain.user import UserDomain
+from domain.user import AsyncUserDomain, UserDomain
 from domain import DomainError
 
 from modules.hashid import HashidsClient
 from modules.mailsender import ABCMailSender
+from modules.pwd import PwdPoolSaturated
 
 from dependencies import (
     authenticate,
+    get_async_user_domain,
     get_id_hasher,
     get_user_domain,
     get_google_sso,
     get_mailsender,
+    limit_by_ip,
+    limit_login_by_email,
+    limit_signup_by_email,
 )
 from schemas.auth import (
     AuthenticatedUserSchema,
@@ -33,7 +38,7 @@ from schemas.auth import (
     SignedUpUserSchema,
     UserVerificationCodeSchema,
 )
-from schemas.user import UserToCreateSchema, PublicUserSchema
+from schemas.user import PUBLIC_USER_FIELDS, UserToCreateSchema, PublicUserSchema
 import exceptions
 
 
@@ -41,18 +46,23 @@ router = APIRouter()
 
 
 @router.post(
-    "/signup", response_model=SignedUpUserSchema, status_code=status.HTTP_201_CREATED
+    "/signup",
+    response_model=SignedUpUserSchema,
+    status_code=status.HTTP_201_CREATED,
+    dependencies=[Depends(limit_by_ip), Depends(limit_signup_by_email)],
 )
 async def signup(
     new_user: UserToCreateSchema,
     background_tasks: BackgroundTasks,
-    user_domain: UserDomain = Depends(get_user_domain),
+    user_domain: AsyncUserDomain = Depends(get_async_user_domain),
     id_hasher: HashidsClient = Depends(get_id_hasher),
     mailsender: ABCMailSender = Depends(get_mailsender),
 ):
     """Create user and send verification code to email"""
     try:
-        created_user, code, token = user_domain.signup(new_user)
+        created_user, code, token = await user_domain.signup(new_user)
+    except PwdPoolSaturated:
+        raise exceptions.ServiceUnavailable("try_again_later")
     except DomainError:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="email_is_taken"
@@ -63,7 +73,9 @@ async def signup(
     background_tasks.add_task(mailsender.send, created_user.email, subject, body)
     logger.info(f"Sending signup code to: {created_user.email}")
 
-    return SignedUpUserSchema(user=id_hasher.encode_obj(created_user), token=token)
+    return SignedUpUserSchema(
+        user=id_hasher.project_one(created_user, PUBLIC_USER_FIELDS), token=token
+    )
 
 
 @router.post("/signup/verify", response_model=PublicUserSchema)
@@ -88,21 +100,27 @@ def signup_verify(
         )
 
     logger.info(f"Verified user: {auth.user.email}")
-    return id_hasher.encode_obj(auth.user)
+    return id_hasher.project_one(auth.user, PUBLIC_USER_FIELDS)
 
 
-@router.post("/login", response_model=TokenSchema)
-def login(
+@router.post(
+    "/login",
+    response_model=TokenSchema,
+    dependencies=[Depends(limit_by_ip), Depends(limit_login_by_email)],
+)
+async def login(
     form_data: OAuth2PasswordRequestForm = Depends(),
-    user_domain: UserDomain = Depends(get_user_domain),
+    user_domain: AsyncUserDomain = Depends(get_async_user_domain),
 ):
     """Obtain JWT token to access API as authorized user"""
     try:
-        _, token = user_domain.login(
+        _, token = await user_domain.login(
             form_data.username,
             form_data.password,
             form_data.scopes,
         )
+    except PwdPoolSaturated:
+        raise exceptions.ServiceUnavailable("try_again_later")
     except DomainError:
         raise exceptions.invalid_credentials
 
@@ -120,24 +138,19 @@ async def google_login(google_sso: GoogleSSO = Depends(get_google_sso)):
 async def google_callback(
     request: Request,
     google_sso: GoogleSSO = Depends(get_google_sso),
-    user_domain: UserDomain = Depends(get_user_domain),
+    user_domain: AsyncUserDomain = Depends(get_async_user_domain),
 ):
     """Process login response from Google and return user info"""
     open_id = await google_sso.verify_and_process(request)
     try:
-        _, token = user_domain.login_by_sso_provider(
-            open_id.id, open_id.provider, open_id.email
+        _, token = await user_domain.login_or_signup_by_sso_provider(
+            open_id.provider, open_id.id, open_id.email
         )
-    except DomainError:
-        try:
-            _, token = user_domain.signup_by_sso_provider(
-                open_id.provider, open_id.id, open_id.email
-            )
-        except DomainError as e:
-            logger.warning(
-                f"Couldn't signup `{open_id.email}`| provider `{open_id.provider}`: {e}"
-            )
-            raise e
+    except DomainError as e:
+        logger.warning(
+            f"Couldn't signup `{open_id.email}`| provider `{open_id.provider}`: {e}"
+        )
+        raise e
     return TokenSchema(access_token=token, token_type="bearer")
 
 
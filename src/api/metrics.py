@@ -0,0 +1,49 @@
+from fastapi import APIRouter, Depends
+
+from dependencies import (
+    authenticate_admin,
+    count_cache,
+    email_rate_limiter,
+    get_mailsender,
+    user_cache,
+    user_listener,
+    get_pwd_client,
+    get_token_cache,
+    ip_rate_limiter,
+)
+from repository.database import async_engine, async_replicas, engine, replicas
+from repository.pool import pool_stats
+from repository.queries import query_metrics
+from modules.jwt import TokenCache
+from modules.mailsender import ABCMailSender
+from modules.pwd import PwdClient
+from schemas.auth import AuthenticatedUserSchema
+
+
+router = APIRouter()
+
+
+@router.get("/metrics", include_in_schema=False)
+def get_metrics(
+    auth: AuthenticatedUserSchema = Depends(authenticate_admin),
+    token_cache: TokenCache = Depends(get_token_cache),
+    pwd_client: PwdClient = Depends(get_pwd_client),
+    mailsender: ABCMailSender = Depends(get_mailsender),
+):
+    """In-process counters of the current worker. Admins only."""
+    return {
+        "token_cache": token_cache.stats(),
+        "pwd": pwd_client.stats(),
+        "mail": mailsender.stats(),
+        "count_cache": count_cache.stats(),
+        "user_cache": {**user_cache.stats(), "listener": user_listener.stats()},
+        "ratelimit": {
+            "ip_rejected": ip_rate_limiter.rejected,
+            "email_rejected": email_rate_limiter.rejected,
+        },
+        "pool": pool_stats(engine),
+        "async_pool": pool_stats(async_engine),
+        "replicas": replicas.stats(),
+        "async_replicas": async_replicas.stats(),
+        "queries": query_metrics.stats(),
+    }
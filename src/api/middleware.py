@@ -0,0 +1,36 @@
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from repository.queries import query_metrics, track_queries
+from settings import settings
+
+
+class QueryStatsMiddleware:
+    """Counts SQL statements of every request into `query_metrics`.
+
+    In debug mode the count and DB time so far are sent as `X-DB-Queries`
+    and `Server-Timing` headers, statements run after the response has started
+    only make it into the metrics.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with track_queries() as stats:
+
+            async def send_with_stats(message: Message) -> None:
+                if message["type"] == "http.response.start" and settings.debug:
+                    headers = MutableHeaders(scope=message)
+                    headers.append("X-DB-Queries", str(stats.statements))
+                    headers.append("Server-Timing", f"db;dur={stats.seconds * 1000:.3f}")
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_stats)
+            finally:
+                query_metrics.observe(stats)
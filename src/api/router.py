@@ -1,8 +1,9 @@
 from fastapi import APIRouter
 
-from api import auth, users
+from api import auth, metrics, users
 
 
 router = APIRouter()
 router.include_router(auth.router, tags=["auth"])
 router.include_router(users.router, tags=["users"])
+router.include_router(metrics.router, tags=["metrics"])
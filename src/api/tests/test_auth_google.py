@@ -0,0 +1,85 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+
+import pytest
+from requests.models import Response
+
+from fastapi.testclient import TestClient
+from fastapi_sso.sso.base import OpenID
+
+import dependencies
+from domain import DomainError
+from domain.user import UserDomain
+from repository.database import SessionLocal
+from repository.models import SSOAuthorization, User
+from repository.user import UserRepository
+from settings import settings
+
+
+URI = f"/v{settings.api_version}/login/google/callback"
+
+
+@pytest.fixture(autouse=True)
+def open_id(monkeypatch) -> OpenID:
+    open_id = OpenID(id="google-1", email="sso_test@gmail.com", provider="google")
+
+    async def verify_and_process(request):
+        return open_id
+
+    monkeypatch.setattr(
+        dependencies.google_sso, "verify_and_process", verify_and_process
+    )
+    return open_id
+
+
+def test_signup_then_login(
+    client: TestClient,
+    query_budget,
+    user_repository: UserRepository,
+    open_id: OpenID,
+):
+    response: Response = client.get(URI)
+    assert response.status_code == 200, response.json()
+    query_budget(response, 1)
+    user = user_repository.get_by_email(open_id.email)
+    assert user.is_email_verified
+    sso_auth = user_repository.session.query(SSOAuthorization).filter_by(
+        user_id=user.id
+    )
+    assert [(sso.provider_name, sso.provider_id) for sso in sso_auth] == [
+        (open_id.provider, open_id.id)
+    ]
+
+    response = client.get(URI)
+    assert response.status_code == 200, response.json()
+    query_budget(response, 1)
+    assert response.json()["access_token"]
+
+
+def test_email_taken(user_domain: UserDomain, verified_user: User):
+    with pytest.raises(DomainError):
+        user_domain.login_or_signup_by_sso_provider(
+            "google", "google-2", verified_user.email
+        )
+
+
+def test_concurrent_first_login(user_domain: UserDomain, open_id: OpenID):
+    with closing(SessionLocal()) as session:
+        first = UserRepository(session).upsert_user_by_sso_provider(
+            open_id.provider, open_id.id, open_id.email
+        )
+        assert first is not None
+        with ThreadPoolExecutor(1) as pool:
+            second = pool.submit(
+                user_domain.login_or_signup_by_sso_provider,
+                open_id.provider,
+                open_id.id,
+                open_id.email,
+            )
+            # let the second callback block on the uncommitted email
+            time.sleep(0.2)
+            session.commit()
+            user, _ = second.result(timeout=5)
+
+    assert user.id == first.id
@@ -1,8 +1,14 @@
+import pytest
 from requests.models import Response
 
 from fastapi.testclient import TestClient
 
+from dependencies import get_async_user_domain, pwd_client
+from main import app
+from modules.pwd import PwdClient
+from modules.pwd.client import new_pwd_context
 from repository.models import User
+from repository.user import UserRepository
 from settings import settings
 
 
@@ -48,3 +54,96 @@ def test_user_from_sso_without_password(client: TestClient, user_from_sso: User)
         data={"username": user_from_sso.email, "password": "bad_password"},
     )
     assert response.status_code == 401
+
+
+def test_hashing_pool_saturated(
+    client: TestClient, verified_user: User, monkeypatch: pytest.MonkeyPatch
+):
+    monkeypatch.setattr(pwd_client, "max_pending", 0)
+    response: Response = client.post(
+        URI,
+        data={"username": verified_user.email, "password": "password"},
+    )
+    assert response.status_code == 503
+
+
+def test_outdated_hash_is_upgraded(
+    client: TestClient, user_repository: UserRepository, verified_user: User
+):
+    bcrypt_hash = new_pwd_context(scheme="bcrypt", bcrypt_rounds=4).hash("password")
+    user_repository.update_password(verified_user.id, bcrypt_hash)
+    user_repository.commit()
+
+    response: Response = client.post(
+        URI,
+        data={"username": verified_user.email, "password": "password"},
+    )
+    assert response.status_code == 200
+
+    user_repository.session.expire_all()
+    new_hash = user_repository.get_by_id(verified_user.id).password
+    assert new_hash != bcrypt_hash
+    assert not pwd_client.pwd_context.needs_update(new_hash)
+
+
+def test_clients_keep_their_own_settings():
+    other_client = PwdClient(scheme="bcrypt", bcrypt_rounds=4)
+    assert other_client.get_password_hash("password").startswith("$2b$04$")
+
+    app_hash = pwd_client.get_password_hash("password")
+    assert app_hash.startswith(f"${settings.pwd.scheme}")
+    assert not pwd_client.pwd_context.needs_update(app_hash)
+
+
+def test_rate_limited_by_email(client: TestClient, verified_user: User):
+    hashed = pwd_client.metrics.count
+    for _ in range(settings.ratelimit.email_burst):
+        response: Response = client.post(
+            URI,
+            data={"username": verified_user.email, "password": "bad_password"},
+        )
+        assert response.status_code == 401
+
+    response = client.post(
+        URI,
+        data={"username": verified_user.email, "password": "password"},
+    )
+    assert response.status_code == 429
+    assert response.headers["Retry-After"]
+    assert pwd_client.metrics.count - hashed == settings.ratelimit.email_burst
+
+
+def test_rate_limited_before_db_session(client: TestClient, verified_user: User):
+    for _ in range(settings.ratelimit.email_burst):
+        client.post(URI, data={"username": verified_user.email, "password": "bad"})
+
+    resolved = []
+    app.dependency_overrides[get_async_user_domain] = lambda: resolved.append(1)
+    try:
+        response: Response = client.post(
+            URI, data={"username": verified_user.email, "password": "password"}
+        )
+    finally:
+        app.dependency_overrides.pop(get_async_user_domain)
+    assert response.status_code == 429
+    assert not resolved
+
+
+def test_rate_limited_per_forwarded_client(client: TestClient, monkeypatch):
+    # TestClient requests come from "testclient", standing in for the ingress
+    monkeypatch.setattr(settings.ratelimit, "trusted_proxies", ["testclient"])
+
+    def login(forwarded_for: str, attempt: int) -> Response:
+        return client.post(
+            URI,
+            data={"username": f"user{attempt}@example.com", "password": "password"},
+            headers={"X-Forwarded-For": forwarded_for},
+        )
+
+    for attempt in range(settings.ratelimit.ip_burst):
+        assert login("203.0.113.1", attempt).status_code == 401
+    assert login("203.0.113.1", -1).status_code == 429
+    # addresses the client put in front of its own don't get it a new bucket
+    assert login("198.51.100.7, 203.0.113.1", -2).status_code == 429
+
+    assert login("198.51.100.7", -3).status_code == 401
@@ -1,10 +1,16 @@
 import pytest
 from requests.models import Response
 
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm.exc import NoResultFound
 
 from fastapi.testclient import TestClient
 
+import dependencies
+from benchmarks.smtp_sink import SMTPSink, self_signed_contexts
+from main import app
+from modules.mailsender.client import MailSenderClient
 from repository.user import UserRepository
 from domain.user import UserDomain
 from schemas.user import UserToCreateSchema
@@ -14,13 +20,16 @@ from settings import settings
 URI = f"/v{settings.api_version}/signup"
 
 
-def test_valid_user(client: TestClient, user_repository: UserRepository):
+def test_valid_user(
+    client: TestClient, query_budget, user_repository: UserRepository
+):
     response: Response = client.post(
         URI,
         json={"email": "test@gmail.com", "password": "password"},
         headers={"Content-Type": "Application/json"},
     )
     assert response.status_code == 201, response.json()
+    query_budget(response, 2)
     assert response.json().get("user").get("email") == "test@gmail.com", response.json()
 
     assert user_repository.get_by_email("test@gmail.com")
@@ -48,3 +57,74 @@ def test_existing_email(client: TestClient, user_domain: UserDomain):
     )
     assert response.status_code == 400
     assert user_domain.get_by_email("existing_email_test@gmail.com")
+
+
+def test_commits_once(client: TestClient):
+    commits = []
+    listener = lambda connection: commits.append(connection)  # noqa: E731
+    event.listen(Engine, "commit", listener)
+    try:
+        response: Response = client.post(
+            URI, json={"email": "test@gmail.com", "password": "password"}
+        )
+    finally:
+        event.remove(Engine, "commit", listener)
+    assert response.status_code == 201, response.json()
+    assert len(commits) == 1
+
+
+def test_failed_signup_leaves_nothing(
+    monkeypatch, user_domain: UserDomain, user_repository: UserRepository
+):
+    def fail(*args, **kwargs):
+        raise RuntimeError("verification code")
+
+    monkeypatch.setattr(user_repository, "create_verification_code", fail)
+    with pytest.raises(RuntimeError):
+        user_domain.signup(
+            UserToCreateSchema(email="test@gmail.com", password="password")
+        )
+    with pytest.raises(NoResultFound):
+        user_repository.get_by_email("test@gmail.com")
+
+
+@pytest.fixture
+def smtp_sink(monkeypatch):
+    server_context, client_context = self_signed_contexts()
+    sink = SMTPSink(tls_context=server_context)
+    sink.start()
+    monkeypatch.setattr(
+        dependencies,
+        "mailsender",
+        MailSenderClient(
+            "127.0.0.1",
+            sink.port,
+            "noreply@example.com",
+            "password",
+            pool_size=2,
+            tls_context=client_context,
+        ),
+    )
+    yield sink
+    sink.stop()
+
+
+def test_verification_emails_share_connection(smtp_sink: SMTPSink):
+    with TestClient(app) as client:
+        for i in range(3):
+            response: Response = client.post(
+                URI, json={"email": f"test{i}@gmail.com", "password": "password"}
+            )
+            assert response.status_code == 201, response.json()
+        smtp_sink.drop_connections()
+        response = client.post(
+            URI, json={"email": "test3@gmail.com", "password": "password"}
+        )
+        assert response.status_code == 201, response.json()
+
+    assert [envelope.rcpt_tos for envelope in smtp_sink.messages] == [
+        [f"test{i}@gmail.com"] for i in range(4)
+    ]
+    # one handshake, and another after the server dropped the connection
+    assert smtp_sink.tls_handshakes == 2
+    assert dependencies.mailsender.stats()["reconnects"] == 1
@@ -2,6 +2,8 @@ import pytest
 
 from requests.models import Response
 
+from sqlalchemy import select
+from sqlalchemy.exc import InvalidRequestError
 from sqlalchemy.orm.exc import NoResultFound
 
 from fastapi.testclient import TestClient
@@ -16,6 +18,7 @@ URI = f"/v{settings.api_version}/signup/verify"
 
 def test_valid_code(
     client: TestClient,
+    query_budget,
     user_repository: UserRepository,
     unverified_user: User,
     unverified_user_signup_token: str,
@@ -31,12 +34,25 @@ def test_valid_code(
         },
     )
     assert response.status_code == 200, response.json()
+    # the user, the code joined with its user, marking verified, deleting the code
+    query_budget(response, 4)
     assert user_repository.get_by_email(unverified_user.email).is_email_verified
 
     with pytest.raises(NoResultFound):
         user_repository.get_verification_code(unverified_user.id, code)
 
 
+def test_lazy_load_raises(
+    user_repository: UserRepository,
+    unverified_user: User,
+    unverified_user_verification_code: VerificationCode,
+):
+    user_repository.session.expunge_all()
+    code = user_repository.session.execute(select(VerificationCode)).scalar_one()
+    with pytest.raises(InvalidRequestError):
+        code.user
+
+
 def test_already_verified(
     client: TestClient,
     user_repository: UserRepository,
@@ -0,0 +1,185 @@
+import base64
+import hashlib
+import hmac
+import json
+from datetime import timedelta
+from typing import Callable
+
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
+from cryptography.hazmat.primitives.asymmetric.types import PrivateKeyTypes
+from jose import jwt
+from requests.models import Response
+
+from fastapi.testclient import TestClient
+
+from dependencies import get_jwt_client, get_token_cache, id_hasher
+from main import app
+from modules.jwt import JWTClient, TokenCache, VerifyKey
+from repository.models import User
+from settings import oauth2_scope, settings
+
+
+URI = f"/v{settings.api_version}/profile"
+SCOPES = [oauth2_scope.profile_read.name]
+
+KEY_FACTORIES: dict[str, Callable[[], PrivateKeyTypes]] = {
+    "RS256": lambda: rsa.generate_private_key(public_exponent=65537, key_size=2048),
+    "ES256": lambda: ec.generate_private_key(ec.SECP256R1()),
+    "EdDSA": ed25519.Ed25519PrivateKey.generate,
+}
+BACKEND_ALGORITHMS = [
+    ("jose", "RS256"),
+    ("jose", "ES256"),
+    ("pyjwt", "RS256"),
+    ("pyjwt", "ES256"),
+    ("pyjwt", "EdDSA"),
+]
+
+
+def generate_keys(algorithm: str) -> tuple[str, str]:
+    key = KEY_FACTORIES[algorithm]()
+    private_pem = key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    )
+    public_pem = key.public_key().public_bytes(
+        serialization.Encoding.PEM,
+        serialization.PublicFormat.SubjectPublicKeyInfo,
+    )
+    return private_pem.decode(), public_pem.decode()
+
+
+@pytest.fixture
+def use_jwt_client():
+    """Make the app verify tokens with the given client"""
+
+    def use(jwt_client: JWTClient) -> None:
+        app.dependency_overrides[get_jwt_client] = lambda: jwt_client
+        app.dependency_overrides[get_token_cache] = lambda: TokenCache(maxsize=16)
+
+    yield use
+    app.dependency_overrides.pop(get_jwt_client, None)
+    app.dependency_overrides.pop(get_token_cache, None)
+
+
+def get_profile(client: TestClient, token: str) -> Response:
+    return client.get(URI, headers={"Authorization": f"Bearer {token}"})
+
+
+def b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def forge_token(header: dict, claims: dict, secret: bytes = b"") -> str:
+    """Token with any `header`, HS256 is signed with `secret`, anything else isn't"""
+    signing_input = ".".join(b64(json.dumps(part).encode()) for part in (header, claims))
+    signature = b""
+    if header["alg"] == "HS256":
+        signature = hmac.new(secret, signing_input.encode(), hashlib.sha256).digest()
+    return f"{signing_input}.{b64(signature)}"
+
+
+@pytest.mark.parametrize("backend,algorithm", BACKEND_ALGORITHMS)
+def test_algorithms(
+    client: TestClient, use_jwt_client, verified_user: User, backend, algorithm
+):
+    private_key, public_key = generate_keys(algorithm)
+    jwt_client = JWTClient(private_key, public_key, algorithm, backend=backend)
+    use_jwt_client(jwt_client)
+
+    token = jwt_client.create_token(
+        id_hasher.encode(verified_user.id), timedelta(minutes=5), SCOPES
+    )
+    assert jwt.get_unverified_header(token)["alg"] == algorithm
+
+    response = get_profile(client, token)
+    assert response.status_code == 200, response.json()
+    assert response.json()["email"] == verified_user.email
+
+
+@pytest.mark.parametrize("backend,algorithm", BACKEND_ALGORITHMS)
+def test_rotated_key(
+    client: TestClient, use_jwt_client, verified_user: User, backend, algorithm
+):
+    old_private, old_public = generate_keys("ES256")
+    old_client = JWTClient(old_private, old_public, "ES256", kid="2022-01")
+    old_token = old_client.create_token(
+        id_hasher.encode(verified_user.id), timedelta(minutes=5), SCOPES
+    )
+
+    new_private, new_public = generate_keys(algorithm)
+    new_client = JWTClient(
+        new_private,
+        new_public,
+        algorithm,
+        backend=backend,
+        kid="2022-06",
+        verify_keys=[VerifyKey("2022-01", "ES256", old_public)],
+    )
+    use_jwt_client(new_client)
+
+    assert get_profile(client, old_token).status_code == 200
+    new_token = new_client.create_token(
+        id_hasher.encode(verified_user.id), timedelta(minutes=5), SCOPES
+    )
+    assert jwt.get_unverified_header(new_token)["kid"] == "2022-06"
+    assert get_profile(client, new_token).status_code == 200
+
+
+def test_retired_key(client: TestClient, use_jwt_client, verified_user: User):
+    old_private, old_public = generate_keys("RS256")
+    old_client = JWTClient(old_private, old_public, "RS256", kid="2022-01")
+    old_token = old_client.create_token(
+        id_hasher.encode(verified_user.id), timedelta(minutes=5), SCOPES
+    )
+
+    new_private, new_public = generate_keys("ES256")
+    use_jwt_client(JWTClient(new_private, new_public, "ES256", kid="2022-06"))
+
+    assert get_profile(client, old_token).status_code == 401
+
+
+def test_legacy_kid(client: TestClient, use_jwt_client, verified_user: User):
+    old_private, old_public = generate_keys("RS256")
+    claims = {
+        "sub": id_hasher.encode(verified_user.id),
+        "exp": 2**31,
+        "scopes": SCOPES,
+    }
+    # issued before tokens had a `kid` header
+    legacy_token = jwt.encode(claims, old_private, algorithm="RS256")
+    assert "kid" not in jwt.get_unverified_header(legacy_token)
+
+    new_private, new_public = generate_keys("ES256")
+    for legacy_kid, status_code in [("", 401), ("2022-01", 200)]:
+        use_jwt_client(
+            JWTClient(
+                new_private,
+                new_public,
+                "ES256",
+                kid="2022-06",
+                verify_keys=[VerifyKey("2022-01", "RS256", old_public)],
+                legacy_kid=legacy_kid,
+            )
+        )
+        assert get_profile(client, legacy_token).status_code == status_code
+
+
+@pytest.mark.parametrize("backend", ["jose", "pyjwt"])
+@pytest.mark.parametrize("algorithm", ["HS256", "none"])
+def test_algorithm_differs_from_pinned(
+    client: TestClient, use_jwt_client, verified_user: User, backend, algorithm
+):
+    private_key, public_key = generate_keys("ES256")
+    use_jwt_client(
+        JWTClient(private_key, public_key, "ES256", backend=backend, kid="2022-06")
+    )
+    header = {"alg": algorithm, "typ": "JWT", "kid": "2022-06"}
+    claims = {"sub": id_hasher.encode(verified_user.id), "exp": 2**31, "scopes": SCOPES}
+    # the verifier's own public key as HMAC secret, the classic algorithm confusion
+    token = forge_token(header, claims, secret=public_key.encode())
+
+    assert get_profile(client, token).status_code == 401
@@ -3,6 +3,7 @@ from requests.models import Response
 
 from fastapi.testclient import TestClient
 
+from dependencies import id_hasher, write_pins
 from domain.user import UserDomain, DomainError
 from repository.models import User
 from settings import settings
@@ -28,6 +29,8 @@ def test_valid(
     assert response.status_code == 204, response.json()
     with pytest.raises(DomainError):
         user_domain.get_by_id(user_id)
+    # reads of the deleted user must not be served by a lagging replica
+    assert write_pins.get(id_hasher.encode(user_id))
 
 
 def test_not_enough_rights(
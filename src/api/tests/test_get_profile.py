@@ -0,0 +1,113 @@
+import time
+
+from requests.models import Response
+
+from fastapi.testclient import TestClient
+
+from dependencies import id_hasher, token_cache, user_cache, user_listener, write_pins
+from repository.models import User
+from repository.user import UserRepository
+from settings import settings
+
+
+URI = f"/v{settings.api_version}/profile"
+
+
+def test_valid(
+    client: TestClient, query_budget, verified_user: User, user_auth_token: str
+):
+    response: Response = client.get(
+        URI, headers={"Authorization": f"Bearer {user_auth_token}"}
+    )
+    assert response.status_code == 200, response.json()
+    query_budget(response, 1)
+    assert response.json().get("email") == verified_user.email
+
+
+def test_token_is_verified_once(client: TestClient, user_auth_token: str):
+    token_cache.clear()
+    hits = token_cache.hits
+    for _ in range(3):
+        response: Response = client.get(
+            URI, headers={"Authorization": f"Bearer {user_auth_token}"}
+        )
+        assert response.status_code == 200, response.json()
+    assert token_cache.hits - hits == 2
+
+
+def test_bad_token(client: TestClient, user_auth_token: str):
+    response: Response = client.get(
+        URI, headers={"Authorization": f"Bearer {user_auth_token}bad"}
+    )
+    assert response.status_code == 401
+
+
+def test_not_modified(client: TestClient, user_auth_token: str):
+    headers = {"Authorization": f"Bearer {user_auth_token}"}
+    etag = client.get(URI, headers=headers).headers["ETag"]
+
+    response: Response = client.get(URI, headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    assert not response.content
+
+
+def wait_until_forgotten(user_id: int) -> None:
+    deadline = time.monotonic() + 2
+    while user_cache.get(user_id) is not None:
+        assert time.monotonic() < deadline, "users_changed wasn't delivered"
+        time.sleep(0.005)
+
+
+def test_user_is_cached(
+    client: TestClient, query_budget, verified_user: User, user_auth_token: str
+):
+    headers = {"Authorization": f"Bearer {user_auth_token}"}
+    client.get(URI, headers=headers)
+    response: Response = client.get(URI, headers=headers)
+    assert response.status_code == 200, response.json()
+    query_budget(response, 0)
+
+
+def test_change_is_pushed(
+    client: TestClient,
+    user_repository: UserRepository,
+    verified_user: User,
+    user_auth_token: str,
+):
+    assert user_listener.connected.wait(5)
+    headers = {"Authorization": f"Bearer {user_auth_token}"}
+    client.get(URI, headers=headers)
+    assert user_cache.get(verified_user.id).is_active
+
+    # changed by another worker
+    user_repository.session.query(User).filter_by(id=verified_user.id).update(
+        {"is_active": False}
+    )
+    user_repository.commit()
+    wait_until_forgotten(verified_user.id)
+    assert write_pins.get(id_hasher.encode(verified_user.id))
+
+    response: Response = client.get(URI, headers=headers)
+    assert response.status_code == 200, response.json()
+    assert not user_cache.get(verified_user.id).is_active
+
+
+def test_missing_user_is_cached(
+    client: TestClient,
+    query_budget,
+    user_repository: UserRepository,
+    verified_user: User,
+    user_auth_token: str,
+):
+    assert user_listener.connected.wait(5)
+    headers = {"Authorization": f"Bearer {user_auth_token}"}
+    client.get(URI, headers=headers)
+    user_repository.delete_user(verified_user.id)
+    user_repository.commit()
+    wait_until_forgotten(verified_user.id)
+
+    for budget in (1, 0):
+        response: Response = client.get(URI, headers=headers)
+        assert response.status_code == 401
+        query_budget(response, budget)
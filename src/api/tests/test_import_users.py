@@ -0,0 +1,85 @@
+import json
+
+from requests.models import Response
+
+from fastapi.testclient import TestClient
+
+from dependencies import pwd_client
+from domain.user import UserDomain
+from domain.user_import import import_users
+from repository.models import User
+from settings import settings
+
+
+URI = f"/v{settings.api_version}/users/import"
+
+
+def test_csv(
+    client: TestClient, user_domain: UserDomain, admin: User, user_auth_token: str
+):
+    content = "\n".join(
+        [
+            "email,password,is_email_verified",
+            "new@example.com,password123,true",
+            f"{admin.email},password123,",
+            "New@example.com,password123,",
+            "short@example.com,short,",
+        ]
+    )
+    response: Response = client.post(
+        URI,
+        headers={"Authorization": f"Bearer {user_auth_token}"},
+        files={"file": ("users.csv", content, "text/csv")},
+    )
+    assert response.status_code == 200, response.json()
+    report = response.json()
+    assert report["created"] == 1
+    assert report["duplicates"] == [admin.email, "new@example.com"]
+    assert [record["line"] for record in report["invalid"]] == [5]
+
+    user = user_domain.get_by_email("new@example.com")
+    assert user.is_email_verified
+    assert user_domain.pwd_client.verify_password("password123", user.password)
+
+
+def test_ndjson(user_domain: UserDomain):
+    lines = [
+        json.dumps({"email": f"user{i}@example.com", "password": "password123"})
+        for i in range(5)
+    ]
+    report = import_users(user_domain, [*lines, "not json"], "ndjson", batch_size=2)
+    assert report.created == 5
+    assert [record.line for record in report.invalid] == [6]
+    assert user_domain.count({}) == 5
+
+
+def test_csv_extra_fields(user_domain: UserDomain):
+    lines = [
+        "email,password\n",
+        "first@example.com,password123\n",
+        "second@example.com,password123,extra\n",
+    ]
+    report = import_users(user_domain, lines, "csv")
+    assert report.created == 1
+    assert [record.line for record in report.invalid] == [3]
+    assert user_domain.count({}) == 1
+
+
+def test_not_admin(client: TestClient, verified_user: User, user_auth_token: str):
+    response: Response = client.post(
+        URI,
+        headers={"Authorization": f"Bearer {user_auth_token}"},
+        files={"file": ("users.csv", "email,password\n", "text/csv")},
+    )
+    assert response.status_code == 403
+
+
+def test_one_import_at_a_time(client: TestClient, admin: User, user_auth_token: str):
+    with pwd_client.importing():
+        response: Response = client.post(
+            URI,
+            headers={"Authorization": f"Bearer {user_auth_token}"},
+            files={"file": ("users.csv", "email,password\n", "text/csv")},
+        )
+    assert response.status_code == 409
+    assert not pwd_client.stats()["importing"]
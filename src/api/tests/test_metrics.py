@@ -0,0 +1,79 @@
+import pytest
+from requests.models import Response
+from sqlalchemy import create_engine, exc
+
+from fastapi.testclient import TestClient
+
+from domain.user import UserDomain
+from repository.database import engine
+from repository.models import User
+from repository.pool import InstrumentedQueuePool, pool_stats
+from settings import settings
+
+
+URI = f"/v{settings.api_version}/metrics"
+
+
+@pytest.fixture
+def admin_headers(admin: User, user_auth_token: str) -> dict:
+    return {"Authorization": f"Bearer {user_auth_token}"}
+
+
+@pytest.mark.skipif(settings.pg.null_pool, reason="NullPool keeps no stats")
+def test_pool_stats(client: TestClient, admin_headers: dict):
+    client.get(f"/v{settings.api_version}/users")
+    response: Response = client.get(URI, headers=admin_headers)
+    assert response.status_code == 200, response.json()
+    pool = response.json()["pool"]
+    assert pool["size"] == settings.pg.pool_size
+    assert pool["checkouts"] > 0
+
+
+def test_query_stats(client: TestClient, admin_headers: dict):
+    response: Response = client.get(URI, headers=admin_headers)
+    before = response.json()["queries"]
+    client.get(f"/v{settings.api_version}/users")
+
+    queries = client.get(URI, headers=admin_headers).json()["queries"]
+    assert queries["requests"] == before["requests"] + 2
+    assert queries["statements"] > before["statements"]
+
+
+def test_anonymous(client: TestClient):
+    response: Response = client.get(URI)
+    assert response.status_code == 401
+
+
+def test_not_admin(client: TestClient, user_auth_token: str):
+    response: Response = client.get(
+        URI, headers={"Authorization": f"Bearer {user_auth_token}"}
+    )
+    assert response.status_code == 403
+
+
+def test_checkout_timeout():
+    engine = create_engine(
+        settings.pg.url,
+        poolclass=InstrumentedQueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.1,
+    )
+    with engine.connect():
+        assert pool_stats(engine)["checked_out"] == 1
+        with pytest.raises(exc.TimeoutError):
+            engine.connect()
+
+    stats = pool_stats(engine)
+    assert stats["checked_out"] == 0
+    assert stats["timeouts"] == 1
+    assert stats["max_wait_seconds"] >= 0.1
+    engine.dispose()
+    assert pool_stats(engine)["timeouts"] == 1
+
+
+def test_domain_call_releases_connection(user_domain: UserDomain, verified_user: User):
+    checked_out = engine.pool.checkedout()
+    user = user_domain.get_by_id(verified_user.id)
+    assert engine.pool.checkedout() == checked_out
+    assert user.email == verified_user.email
@@ -0,0 +1,102 @@
+import json
+
+import pytest
+from pydantic import EmailStr
+from requests.models import Response
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from fastapi.testclient import TestClient
+
+from repository.models import User
+from repository.user import UserRepository, select_by_email_prefix
+from schemas.user import PUBLIC_USER_FIELDS
+from settings import settings
+
+
+URI = f"/v{settings.api_version}/users/search"
+
+
+@pytest.fixture
+def users(user_repository: UserRepository) -> list[User]:
+    users = [
+        user_repository.create_user(
+            User(email=EmailStr(email), password="", is_active=active)
+        )
+        for email, active in [
+            ("bob@example.com", True),
+            ("Alice@example.com", True),
+            ("alan@example.com", True),
+            ("al_inactive@example.com", False),
+        ]
+    ]
+    user_repository.commit()
+    return users
+
+
+def test_prefix(
+    client: TestClient, admin: User, user_auth_token: str, users: list[User]
+):
+    response: Response = client.get(
+        URI,
+        params={"email": "AL"},
+        headers={"Authorization": f"Bearer {user_auth_token}"},
+    )
+    assert response.status_code == 200, response.json()
+    assert [user["email"] for user in response.json()] == [
+        "alan@example.com",
+        "Alice@example.com",
+    ]
+
+
+def test_wildcards_are_literal(
+    client: TestClient, admin: User, user_auth_token: str, users: list[User]
+):
+    response: Response = client.get(
+        URI,
+        params={"email": "al_", "active_users": "false"},
+        headers={"Authorization": f"Bearer {user_auth_token}"},
+    )
+    assert response.status_code == 200, response.json()
+    assert [user["email"] for user in response.json()] == ["al_inactive@example.com"]
+
+
+def test_anonymous(client: TestClient, users: list[User]):
+    response: Response = client.get(URI, params={"email": "al"})
+    assert response.status_code == 401
+
+
+def test_not_admin(client: TestClient, user_auth_token: str, users: list[User]):
+    response: Response = client.get(
+        URI,
+        params={"email": "al"},
+        headers={"Authorization": f"Bearer {user_auth_token}"},
+    )
+    assert response.status_code == 403
+
+
+def test_plan_uses_index(db: Session):
+    db.execute(
+        text(
+            "INSERT INTO users (email, password, is_active, is_email_verified) "
+            "SELECT 'user' || i || '@example.com', '', true, false "
+            "FROM generate_series(1, 100) AS i"
+        )
+    )
+    db.commit()
+    # A table this small is cheaper to scan, so make the planner pick the
+    # index whenever the query can actually use it.
+    db.execute(text("SET LOCAL enable_seqscan = off"))
+
+    statement = select_by_email_prefix(
+        "User12345", {"is_active": True}, 20, PUBLIC_USER_FIELDS
+    )
+    compiled = statement.compile(dialect=db.get_bind().dialect)
+    plan = (
+        db.connection()
+        .exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled}", compiled.params)
+        .scalar()
+    )
+    plan = json.dumps(plan)
+    assert "users_email_lower_idx" in plan
+    assert "Seq Scan" not in plan
@@ -1,27 +1,111 @@
-from fastapi import APIRouter, Depends, Security, status, Response
+import codecs
+import csv
+import hashlib
+import io
+import json
+from typing import Any, Iterator, Literal, Optional
 
-from dependencies import get_id_hasher, get_user_domain, authenticate
+from fastapi import (
+    APIRouter,
+    Depends,
+    File,
+    Header,
+    Query,
+    Response,
+    Security,
+    UploadFile,
+    status,
+)
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from loguru import logger
+
+from dependencies import (
+    authenticate,
+    authenticate_admin,
+    get_cursor_hasher,
+    get_id_hasher,
+    get_pwd_client,
+    get_read_user_domain,
+    get_user_domain,
+)
 from domain import DomainError
 from domain.user import UserDomain
+from domain.user_import import ImportFormat, guess_format, import_users
 from modules.hashid import HashidsClient
+from modules.hashid.exceptions import InvalidHash
+from modules.pwd import PwdClient, PwdImportBusy
 from schemas.auth import AuthenticatedUserSchema
-from schemas.user import PaginatedUserSchema, PublicUserSchema
-from settings import oauth2_scope
+from schemas.user import (
+    PUBLIC_USER_FIELDS,
+    PaginatedUserSchema,
+    PublicUserSchema,
+    UserImportReportSchema,
+)
+from settings import oauth2_scope, settings
 import exceptions
 
 
 router = APIRouter()
 
+EXPORT_BATCH_SIZE = 1000
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether `If-None-Match` holds `etag`, compared weakly as RFC 7232 requires"""
+    if not if_none_match:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag.removeprefix("W/") in tags
+
+
+def prevalidated(content: Any, response: Response) -> Any:
+    """Send `content` already shaped like the endpoint's `response_model`.
+
+    In fast JSON mode it is rendered right away, skipping the validation and
+    `jsonable_encoder` pass FastAPI applies to everything else an endpoint
+    returns. Headers set on `response` are carried over.
+    """
+    if not settings.fast_json:
+        return content
+    return ORJSONResponse(content, headers=dict(response.headers))
 
-@router.get("/profile", response_model=PublicUserSchema)
+
+def not_modified(etag: str, cache_control: str) -> Response:
+    return Response(
+        status_code=status.HTTP_304_NOT_MODIFIED,
+        headers={"ETag": etag, "Cache-Control": cache_control},
+    )
+
+
+@router.get(
+    "/profile",
+    response_model=PublicUserSchema,
+    responses={status.HTTP_304_NOT_MODIFIED: {"description": "Not Modified"}},
+)
 def get_profile(
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
     auth: AuthenticatedUserSchema = Security(
         authenticate, scopes=[oauth2_scope.profile_read.name]
     ),
     id_hasher: HashidsClient = Depends(get_id_hasher),
 ):
-    """Get to know yourself"""
-    return id_hasher.encode_obj(auth.user)
+    """Get to know yourself.
+
+    Tagged with a hash of its content, send it back in `If-None-Match` to get
+    `304 Not Modified` while the profile stays the same.
+    """
+    profile = id_hasher.project_one(auth.user, PUBLIC_USER_FIELDS)
+    digest = hashlib.blake2b(
+        json.dumps(profile, sort_keys=True).encode(), digest_size=8
+    ).hexdigest()
+    etag = f'"{digest}"'
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag, "private, no-cache")
+
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "private, no-cache"
+    return prevalidated(profile, response)
 
 
 @router.delete("/profile", response_model=PublicUserSchema)
@@ -38,33 +122,183 @@ def delete_profile(
 
 @router.get("/users", response_model=PaginatedUserSchema)
 def get_users(
-    page: int = 1,
-    page_size: int = 30,
+    response: Response,
+    cursor: Optional[str] = None,
+    page: int = Query(1, ge=1),
+    page_size: int = Query(30, ge=1, le=1000),
+    pagination: Literal["cursor", "offset"] = "cursor",
+    count_strategy: Literal["exact", "estimated", "cached"] = "cached",
     active_users: bool = True,
-    user_domain: UserDomain = Depends(get_user_domain),
+    user_domain: UserDomain = Depends(get_read_user_domain),
+    id_hasher: HashidsClient = Depends(get_id_hasher),
+    cursor_hasher: HashidsClient = Depends(get_cursor_hasher),
+):
+    """Get users ordered by id. Only active users retrieved by default.
+
+    Pages are walked with `next_cursor`; `pagination=offset` takes a `page`
+    number instead, which gets slower the deeper it goes. `count` is the total
+    of matching users, computed with `count_strategy`.
+    """
+    filters = {}
+    if active_users:
+        filters["is_active"] = True
+    count = user_domain.count(filters, count_strategy)
+
+    if pagination == "offset":
+        rows = user_domain.fetch_rows(
+            filters, page - 1, page_size, PUBLIC_USER_FIELDS
+        )
+        users = id_hasher.project(rows, PUBLIC_USER_FIELDS)
+        return prevalidated(
+            {"count": count, "items": users, "next_cursor": None}, response
+        )
+
+    try:
+        after_id = cursor_hasher.decode(cursor) if cursor else None
+    except InvalidHash:
+        raise exceptions.BadRequest("invalid_cursor")
+
+    # one extra row tells whether there is a next page
+    rows = user_domain.fetch_rows_after(
+        filters, after_id, page_size + 1, PUBLIC_USER_FIELDS
+    )
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = cursor_hasher.encode(rows[-1].id)
+
+    users = id_hasher.project(rows, PUBLIC_USER_FIELDS)
+    return prevalidated(
+        {"count": count, "items": users, "next_cursor": next_cursor}, response
+    )
+
+
+@router.get("/users/search", response_model=list[PublicUserSchema])
+def search_users(
+    response: Response,
+    email: str = Query(..., min_length=1, max_length=127),
+    limit: int = Query(20, ge=1, le=100),
+    active_users: bool = True,
+    auth: AuthenticatedUserSchema = Depends(authenticate_admin),
+    user_domain: UserDomain = Depends(get_read_user_domain),
+    id_hasher: HashidsClient = Depends(get_id_hasher),
+):
+    """Find users whose email starts with `email`, case-insensitively.
+    Only active users retrieved by default. Admins only.
+    """
+    filters = {}
+    if active_users:
+        filters["is_active"] = True
+
+    rows = user_domain.search_rows(email, filters, limit, PUBLIC_USER_FIELDS)
+    return prevalidated(id_hasher.project(rows, PUBLIC_USER_FIELDS), response)
+
+
+@router.get("/users/export", response_class=StreamingResponse)
+def export_users(
+    format: Literal["ndjson", "csv"] = "ndjson",
+    active_users: bool = True,
+    auth: AuthenticatedUserSchema = Depends(authenticate_admin),
+    user_domain: UserDomain = Depends(get_read_user_domain),
     id_hasher: HashidsClient = Depends(get_id_hasher),
 ):
-    """Get users. Only active users retrieved by default"""
-    offset = (page - 1) * page_size
+    """Stream every user as NDJSON or CSV. Only active users exported by default.
+    Admins only.
+    """
     filters = {}
     if active_users:
         filters["is_active"] = True
-    users = [
-        id_hasher.encode_obj(user)
-        for user in user_domain.fetch(filters, offset, page_size)
-    ]
-    return PaginatedUserSchema(count=len(users), items=users)
+
+    batches = user_domain.stream(filters, PUBLIC_USER_FIELDS, EXPORT_BATCH_SIZE)
+    if format == "csv":
+        return StreamingResponse(
+            export_csv(batches, id_hasher),
+            media_type="text/csv",
+            headers={"Content-Disposition": 'attachment; filename="users.csv"'},
+        )
+    return StreamingResponse(
+        export_ndjson(batches, id_hasher), media_type="application/x-ndjson"
+    )
 
 
-@router.get("/users/{user_id}", response_model=PublicUserSchema)
+def export_ndjson(batches: Iterator[list], id_hasher: HashidsClient) -> Iterator[str]:
+    for batch in batches:
+        yield "".join(
+            json.dumps(row) + "\n"
+            for row in id_hasher.project(batch, PUBLIC_USER_FIELDS)
+        )
+
+
+def export_csv(batches: Iterator[list], id_hasher: HashidsClient) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=PUBLIC_USER_FIELDS)
+    writer.writeheader()
+    for batch in batches:
+        writer.writerows(id_hasher.project(batch, PUBLIC_USER_FIELDS))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+@router.post("/users/import", response_model=UserImportReportSchema)
+def import_users_file(
+    file: UploadFile = File(...),
+    format: Optional[ImportFormat] = None,
+    auth: AuthenticatedUserSchema = Depends(authenticate_admin),
+    user_domain: UserDomain = Depends(get_user_domain),
+    pwd_client: PwdClient = Depends(get_pwd_client),
+):
+    """Create users from a CSV or NDJSON file with `email` and `password` of each.
+    Existing emails are reported as duplicates and skipped. Admins only, one
+    import at a time.
+    """
+    lines = codecs.iterdecode(file.file, "utf-8")
+    try:
+        with pwd_client.importing() as executor:
+            report = import_users(
+                user_domain,
+                lines,
+                format or guess_format(file.filename or ""),
+                executor=executor,
+            )
+    except PwdImportBusy:
+        raise exceptions.Conflict("import_in_progress")
+    logger.info(
+        f"{auth.user.email} imported {report.created} users, "
+        f"{len(report.duplicates)} duplicates, {len(report.invalid)} invalid"
+    )
+    return report
+
+
+@router.get(
+    "/users/{user_id}",
+    response_model=PublicUserSchema,
+    responses={status.HTTP_304_NOT_MODIFIED: {"description": "Not Modified"}},
+)
 def get_user_by_id(
     user_id: str,
-    user_domain: UserDomain = Depends(get_user_domain),
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    user_domain: UserDomain = Depends(get_read_user_domain),
     id_hasher: HashidsClient = Depends(get_id_hasher),
 ):
+    """Get a user, tagged with its row version.
+
+    With a matching `If-None-Match` only the version is read from the database
+    and `304 Not Modified` is returned.
+    """
     try:
-        user = user_domain.get_by_id(id_hasher.decode(user_id))
-    except DomainError:
+        id = id_hasher.decode(user_id)
+        if if_none_match:
+            etag = f'"{user_domain.get_row_by_id(id, ["version"]).version}"'
+            if etag_matches(if_none_match, etag):
+                return not_modified(etag, "no-cache")
+
+        user = user_domain.get_row_by_id(id, [*PUBLIC_USER_FIELDS, "version"])
+    except (DomainError, InvalidHash):
         raise exceptions.NotFound(detail="user_not_found")
 
-    return id_hasher.encode_obj(user)
+    response.headers["ETag"] = f'"{user.version}"'
+    response.headers["Cache-Control"] = "no-cache"
+    return prevalidated(id_hasher.project_one(user, PUBLIC_USER_FIELDS), response)
@@ -0,0 +1,78 @@
+"""Sign/verify throughput of the JWT backends per algorithm, single core.
+
+    cd src && python -m benchmarks.bench_jwt
+"""
+import timeit
+from datetime import timedelta
+from typing import Callable
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
+from cryptography.hazmat.primitives.asymmetric.types import PrivateKeyTypes
+from jose import jwt
+
+from modules.jwt import JWTClient
+from modules.jwt.backends import BACKENDS
+
+
+NUMBER = 500
+
+KEY_FACTORIES: dict[str, Callable[[], PrivateKeyTypes]] = {
+    "RS256": lambda: rsa.generate_private_key(public_exponent=65537, key_size=2048),
+    "ES256": lambda: ec.generate_private_key(ec.SECP256R1()),
+    "EdDSA": ed25519.Ed25519PrivateKey.generate,
+}
+
+
+def generate_keys(algorithm: str) -> tuple[str, str]:
+    key = KEY_FACTORIES[algorithm]()
+    private_pem = key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    )
+    public_pem = key.public_key().public_bytes(
+        serialization.Encoding.PEM,
+        serialization.PublicFormat.SubjectPublicKeyInfo,
+    )
+    return private_pem.decode(), public_pem.decode()
+
+
+def report(name: str, sign, verify) -> None:
+    sign_time = timeit.timeit(sign, number=NUMBER)
+    verify_time = timeit.timeit(verify, number=NUMBER)
+    print(
+        f"{name:<24} sign {NUMBER / sign_time:>9.0f} tokens/s"
+        f"   verify {NUMBER / verify_time:>9.0f} tokens/s"
+    )
+
+
+def main() -> None:
+    claims = {"sub": "bench", "scopes": ["profile_read"]}
+
+    for algorithm in KEY_FACTORIES:
+        private_key, public_key = generate_keys(algorithm)
+
+        if algorithm == "RS256":
+            # how every call worked before keys were parsed once at construction
+            raw_token = jwt.encode(claims, private_key, algorithm=algorithm)
+            report(
+                f"{algorithm} jose (raw PEM)",
+                lambda: jwt.encode(claims, private_key, algorithm=algorithm),
+                lambda: jwt.decode(raw_token, public_key, algorithms=algorithm),
+            )
+
+        for name, backend in BACKENDS.items():
+            if algorithm not in backend.algorithms:
+                continue
+            client = JWTClient(private_key, public_key, algorithm, backend=name)
+            token = client.create_token("bench", timedelta(minutes=5))
+            report(
+                f"{algorithm} {name}",
+                lambda: client.create_token("bench", timedelta(minutes=5)),
+                lambda: client.read_token(token),
+            )
+
+
+if __name__ == "__main__":
+    main()
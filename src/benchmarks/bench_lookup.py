@@ -0,0 +1,104 @@
+"""Per-lookup overhead of the hot `UserRepository` reads against the configured
+PostgreSQL: statements rebuilt per call vs prebuilt ones, and asyncpg with and
+without its prepared statement cache. Needs a migrated database.
+
+    cd src && python -m benchmarks.bench_lookup
+"""
+import asyncio
+import time
+import timeit
+
+from pydantic import EmailStr
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from repository.database import SessionLocal
+from repository.models import User
+from repository.user import AsyncUserRepository, UserRepository, select_fields
+from schemas.user import USER_FIELDS
+from settings import settings
+
+
+NUMBER = 5000
+
+
+def report(name: str, seconds: float) -> None:
+    print(f"{name:<40} {seconds * 1_000_000:>8.1f} us/lookup")
+
+
+def measure(func) -> float:
+    func()
+    return timeit.timeit(func, number=NUMBER) / NUMBER
+
+
+def bench_sync(user_id: int) -> None:
+    session = SessionLocal()
+    repository = UserRepository(session)
+
+    def query_by_id():
+        # how lookups were built before
+        session.query(User).filter_by(id=user_id).one()
+        session.expunge_all()
+
+    def prebuilt_by_id():
+        repository.get_by_id(user_id)
+        session.expunge_all()
+
+    report("get_by_id, Query per call", measure(query_by_id))
+    report("get_by_id, prebuilt", measure(prebuilt_by_id))
+    report(
+        "get_row_by_id, select per call",
+        measure(
+            lambda: session.execute(
+                select_fields(USER_FIELDS).filter_by(id=user_id)
+            ).one()
+        ),
+    )
+    report(
+        "get_row_by_id, prebuilt",
+        measure(lambda: repository.get_row_by_id(user_id, USER_FIELDS)),
+    )
+    session.close()
+
+
+async def bench_async(user_id: int, cache_size: int) -> float:
+    url = make_url(settings.pg.async_url).update_query_dict(
+        {"prepared_statement_cache_size": str(cache_size)}
+    )
+    engine = create_async_engine(url, connect_args=settings.pg.async_args)
+    async with AsyncSession(engine) as session:
+        repository = AsyncUserRepository(session)
+        await repository.get_row_by_id(user_id, USER_FIELDS)
+        start = time.perf_counter()
+        for _ in range(NUMBER):
+            await repository.get_row_by_id(user_id, USER_FIELDS)
+        elapsed = (time.perf_counter() - start) / NUMBER
+    await engine.dispose()
+    return elapsed
+
+
+def main() -> None:
+    session = SessionLocal()
+    user = User(email=EmailStr("bench_lookup@example.com"), password="")
+    session.add(user)
+    session.commit()
+    try:
+        bench_sync(user.id)
+        try:
+            import asyncpg  # noqa: F401
+        except ImportError:
+            print("asyncpg is not installed, skipping async lookups")
+            return
+        for cache_size in (0, settings.pg.prepared_statement_cache_size or 100):
+            report(
+                f"async get_row_by_id, {cache_size} prepared",
+                asyncio.run(bench_async(user.id, cache_size)),
+            )
+    finally:
+        session.execute(User.__table__.delete().where(User.id == user.id))
+        session.commit()
+        session.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Deliver a burst of signup emails to a local STARTTLS sink.
+
+Compares a connection per message, sent from the threadpool like background
+tasks used to, with the pooled async sender. Requires `aiosmtpd`.
+
+    cd src && python -m benchmarks.bench_mail
+"""
+import asyncio
+import smtplib
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from modules.mailsender.client import MailSenderClient
+from benchmarks.smtp_sink import SMTPSink, self_signed_contexts
+
+
+MESSAGES = 200
+# anyio's default worker thread limit, which ran BackgroundTasks
+THREADS = 40
+ADDRESS = "noreply@example.com"
+
+
+def send_with_new_connection(port: int, tls_context, recipient: str) -> None:
+    server = smtplib.SMTP("127.0.0.1", port)
+    server.starttls(context=tls_context)
+    server.login(ADDRESS, "password")
+    server.sendmail(ADDRESS, recipient, "Subject: Verify your email\n\n123456")
+    server.quit()
+
+
+async def send_pooled(client: MailSenderClient) -> None:
+    await asyncio.gather(
+        *(
+            client.send(f"user{i}@example.com", "Verify your email", "123456")
+            for i in range(MESSAGES)
+        )
+    )
+    await client.close()
+
+
+def report(name: str, sink: SMTPSink, seconds: float) -> None:
+    print(
+        f"{name:<32} {MESSAGES / seconds:>7.0f} messages/s"
+        f"   {sink.tls_handshakes:>4} TLS handshakes"
+    )
+
+
+def main() -> None:
+    server_context, client_context = self_signed_contexts()
+
+    sink = SMTPSink(tls_context=server_context)
+    sink.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(THREADS) as pool:
+        for future in [
+            pool.submit(
+                send_with_new_connection,
+                sink.port,
+                client_context,
+                f"user{i}@example.com",
+            )
+            for i in range(MESSAGES)
+        ]:
+            future.result()
+    report(f"connection per message x{THREADS}", sink, time.perf_counter() - start)
+    assert len(sink.messages) == MESSAGES
+    sink.stop()
+
+    for pool_size in (1, 4, 16):
+        sink = SMTPSink(tls_context=server_context)
+        sink.start()
+        client = MailSenderClient(
+            "127.0.0.1",
+            sink.port,
+            ADDRESS,
+            "password",
+            pool_size=pool_size,
+            tls_context=client_context,
+        )
+        start = time.perf_counter()
+        asyncio.run(send_pooled(client))
+        report(f"pooled, pool_size={pool_size}", sink, time.perf_counter() - start)
+        assert len(sink.messages) == MESSAGES
+        sink.stop()
+
+
+if __name__ == "__main__":
+    main()
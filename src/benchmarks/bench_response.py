@@ -0,0 +1,79 @@
+"""Serializing a 1000-item `PaginatedUserSchema` page: default vs fast JSON path.
+
+    cd src && python -m benchmarks.bench_response
+"""
+import asyncio
+import timeit
+from typing import NamedTuple
+
+import orjson
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from modules.hashid import HashidsClient
+from schemas.user import PUBLIC_USER_FIELDS, PaginatedUserSchema
+
+
+ROWS = 1000
+NUMBER = 50
+
+response_field = create_response_field(name="bench", type_=PaginatedUserSchema)
+
+
+class Row(NamedTuple):
+    """A row selected with PUBLIC_USER_FIELDS"""
+
+    id: int
+    email: str
+    is_email_verified: bool
+
+
+def make_page() -> dict:
+    id_hasher = HashidsClient("benchmark", min_length=10)
+    rows = [Row(i, f"user{i}@example.com", True) for i in range(1, ROWS + 1)]
+    items = id_hasher.project(rows, PUBLIC_USER_FIELDS)
+    return {"count": ROWS, "items": items, "next_cursor": "next"}
+
+
+def default_path(page: dict) -> bytes:
+    # how get_users answered before: build the model, then FastAPI validates it
+    # again against `response_model`, runs jsonable_encoder and stdlib json
+    content = PaginatedUserSchema(**page)
+    encoded = asyncio.run(
+        serialize_response(field=response_field, response_content=content)
+    )
+    return JSONResponse(encoded).body
+
+
+def validated_once(page: dict) -> bytes:
+    # a plain dict is only validated by `response_model`
+    encoded = asyncio.run(
+        serialize_response(field=response_field, response_content=page)
+    )
+    return JSONResponse(encoded).body
+
+
+def fast_path(page: dict) -> bytes:
+    return orjson.dumps(page)
+
+
+def measure(func) -> float:
+    return timeit.timeit(func, number=NUMBER) / NUMBER
+
+
+def report(name: str, seconds: float) -> None:
+    print(f"{name:<32} {seconds * 1000:>8.2f} ms/page")
+
+
+def main() -> None:
+    page = make_page()
+    assert orjson.loads(default_path(page)) == orjson.loads(fast_path(page))
+
+    report("model + response_model + json", measure(lambda: default_path(page)))
+    report("dict + response_model + json", measure(lambda: validated_once(page)))
+    report("prevalidated dict + orjson", measure(lambda: fast_path(page)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""Local SMTP server that keeps what it receives, for tests and benchmarks.
+Requires the `aiosmtpd` dev package.
+
+    cd src && python -m benchmarks.smtp_sink --port 1025
+"""
+import argparse
+import asyncio
+import datetime
+import ipaddress
+import socket
+import ssl
+import tempfile
+import time
+from typing import Optional
+
+from aiosmtpd.controller import Controller
+from aiosmtpd.smtp import SMTP, AuthResult, Envelope
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def self_signed_contexts() -> tuple[ssl.SSLContext, ssl.SSLContext]:
+    """Server and client TLS contexts for a throwaway certificate of 127.0.0.1"""
+    key = ec.generate_private_key(ec.SECP256R1())
+    address = ipaddress.ip_address("127.0.0.1")
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "127.0.0.1")])
+    now = datetime.datetime.utcnow()
+    certificate = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(minutes=1))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .add_extension(
+            x509.SubjectAlternativeName([x509.IPAddress(address)]), critical=False
+        )
+        .sign(key, hashes.SHA256())
+    )
+    certificate_pem = certificate.public_bytes(serialization.Encoding.PEM)
+    key_pem = key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    )
+
+    server = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    # the ssl module only loads certificate chains from files
+    with tempfile.NamedTemporaryFile() as chain:
+        chain.write(certificate_pem + key_pem)
+        chain.flush()
+        server.load_cert_chain(chain.name)
+    client = ssl.create_default_context(cadata=certificate_pem.decode())
+    return server, client
+
+
+class SinkHandler:
+    def __init__(self) -> None:
+        self.messages: list[Envelope] = []
+        self.tls_handshakes = 0
+
+    async def handle_DATA(self, server: SMTP, session, envelope: Envelope) -> str:
+        self.messages.append(envelope)
+        return "250 OK"
+
+    def handle_STARTTLS(self, server: SMTP, session, envelope: Envelope) -> bool:
+        self.tls_handshakes += 1
+        return True
+
+
+class SMTPSink(Controller):
+    """SMTP server on its own thread that accepts any login and every message.
+
+    With `tls_context` it offers STARTTLS. `drop_connections` closes every
+    open connection, like a server timing out idle clients.
+    """
+
+    def __init__(
+        self,
+        hostname: str = "127.0.0.1",
+        port: Optional[int] = None,
+        tls_context: Optional[ssl.SSLContext] = None,
+    ):
+        self.sink = SinkHandler()
+        super().__init__(
+            self.sink,
+            hostname=hostname,
+            port=port or free_port(),
+            tls_context=tls_context,
+            authenticator=lambda *args: AuthResult(success=True),
+            auth_require_tls=False,
+        )
+        self.connections: list[SMTP] = []
+
+    def factory(self) -> SMTP:
+        server = super().factory()
+        self.connections.append(server)
+        return server
+
+    def start(self) -> None:
+        super().start()
+        # leave out the connection `start` makes to check the server is up
+        self.connections.clear()
+
+    @property
+    def messages(self) -> list[Envelope]:
+        return self.sink.messages
+
+    @property
+    def tls_handshakes(self) -> int:
+        return self.sink.tls_handshakes
+
+    def drop_connections(self) -> None:
+        async def close() -> None:
+            for server in self.connections:
+                if server.transport is not None:
+                    server.transport.close()
+            self.connections.clear()
+
+        asyncio.run_coroutine_threadsafe(close(), self.loop).result()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Local SMTP server that prints what it receives"
+    )
+    parser.add_argument("--port", type=int, default=1025)
+    args = parser.parse_args()
+
+    sink = SMTPSink(port=args.port)
+    sink.start()
+    print(f"Accepting mail on 127.0.0.1:{args.port}, Ctrl+C to stop")
+    try:
+        seen = 0
+        while True:
+            time.sleep(0.5)
+            for envelope in sink.messages[seen:]:
+                content = envelope.content or b""
+                if isinstance(content, bytes):
+                    content = content.decode(errors="replace")
+                print(content, end="\n\n")
+            seen = len(sink.messages)
+    except KeyboardInterrupt:
+        sink.stop()
+
+
+if __name__ == "__main__":
+    main()
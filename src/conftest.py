@@ -12,10 +12,19 @@ from repository.user import UserRepository
 from settings import settings, oauth2_scope
 from repository.database import SessionLocal, Base
 from domain.user import UserDomain
-from schemas.user import UserInDbSchema, UserToCreateSchema
+from schemas.user import UserSchema, UserToCreateSchema
 
 from main import app
-from dependencies import id_hasher, jwt_client, pwd_client
+from dependencies import (
+    count_cache,
+    email_rate_limiter,
+    id_hasher,
+    ip_rate_limiter,
+    jwt_client,
+    pwd_client,
+    user_cache,
+    write_pins,
+)
 
 
 meta = MetaData()
@@ -30,11 +39,35 @@ def teardown():
         tables = ",".join(table.name for table in reversed(Base.metadata.sorted_tables))
         con.execute(f"TRUNCATE {tables};")
         trans.commit()
+    ip_rate_limiter.clear()
+    email_rate_limiter.clear()
+    count_cache.clear()
+    user_cache.clear()
+    write_pins.clear()
+
+
+@pytest.fixture(autouse=True)
+def raise_on_lazy_load(monkeypatch):
+    """Fail tests on N+1 queries instead of letting them reach production"""
+    monkeypatch.setattr(settings.pg, "raise_on_lazy_load", True)
 
 
 @pytest.fixture
-def client() -> TestClient:
-    return TestClient(app)
+def query_budget(monkeypatch):
+    """Assert a response ran at most `budget` SQL statements"""
+    monkeypatch.setattr(settings, "debug", True)
+
+    def check(response, budget: int) -> None:
+        statements = int(response.headers["X-DB-Queries"])
+        assert statements <= budget, f"{statements} SQL statements, budget {budget}"
+
+    return check
+
+
+@pytest.fixture
+def client():
+    with TestClient(app) as client:
+        yield client
 
 
 @pytest.fixture
@@ -95,15 +128,21 @@ def verified_user(
     unverified_user_verification_code: VerificationCode,
 ) -> User:
     user_domain.verify_email(
-        UserInDbSchema.from_orm(unverified_user),
+        UserSchema.from_orm(unverified_user),
         unverified_user_verification_code.code,
     )
     return unverified_user
 
 
+@pytest.fixture
+def admin(monkeypatch, verified_user: User) -> User:
+    monkeypatch.setattr(settings.auth, "admin_emails_str", verified_user.email)
+    return verified_user
+
+
 @pytest.fixture
 def user_from_sso(user_domain: UserDomain):
-    user, _ = user_domain.signup_by_sso_provider(
+    user, _ = user_domain.login_or_signup_by_sso_provider(
         "faker", "1", EmailStr("sso_user@gmail.com")
     )
     return user
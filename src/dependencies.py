@@ -1,28 +1,51 @@
+import ipaddress
+import time
+from functools import lru_cache
+from typing import Optional, Union
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm.session import Session
 
-from jose import JWTError
 from loguru import logger
 
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, Form, HTTPException, Request, Security, status
 from fastapi.security import OAuth2PasswordBearer, SecurityScopes
 from fastapi_sso.sso.google import GoogleSSO
 from domain import DomainError
 
+from sqlalchemy.engine import Row
+
 from schemas.auth import AuthenticatedUserSchema, TokenDataSchema
+from schemas.user import USER_FIELDS, UserToCreateSchema
 
-from settings import settings
-from repository.database import SessionLocal
-from repository.user import UserRepository
-from domain.user import UserDomain
+from settings import oauth2_scope, settings
+from repository.database import (
+    AsyncSessionLocal,
+    SessionLocal,
+    async_replicas,
+    replicas,
+)
+from repository.listener import ChannelListener
+from repository.user import (
+    AsyncUserRepository,
+    ThreadedUserRepository,
+    UserRepository,
+)
+from domain.user import AsyncUserDomain, UserDomain
 
-from modules.jwt import JWTClient
+from modules.cache import TTLCache
+from modules.jwt import JWTClient, TokenCache, InvalidToken, VerifyKey
 from modules.hashid import HashidsClient
 from modules.pwd import PwdClient
 from modules.mailsender import ABCMailSender, new_mailsender
+from modules.ratelimit import RateLimited, new_rate_limiter
 
 import exceptions
 
 
+IPNetwork = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
 oauth2_scheme = OAuth2PasswordBearer(
     tokenUrl=f"v{settings.api_version}/login",
     scopes=settings.auth.oauth2_scopes_details,
@@ -31,15 +54,56 @@ jwt_client = JWTClient(
     private_key=settings.jwt.private_key,
     public_key=settings.jwt.public_key,
     algorithm=settings.jwt.algorithm,
+    backend=settings.jwt.backend,
+    kid=settings.jwt.kid,
+    verify_keys=[VerifyKey(**key.dict()) for key in settings.jwt.verify_keys],
+    legacy_kid=settings.jwt.legacy_kid,
 )
+token_cache = TokenCache(maxsize=settings.jwt.cache_size)
+count_cache = TTLCache(maxsize=1024, ttl=settings.count_cache_ttl)
+# token subjects that wrote recently, their reads go to the primary
+write_pins = TTLCache(maxsize=65536, ttl=settings.pg.read_your_writes)
+# USER_FIELDS rows by user id, MISSING_USER for ids that don't exist
+user_cache = TTLCache(maxsize=settings.user_cache_size, ttl=settings.user_cache_ttl)
+MISSING_USER = object()
 id_hasher = HashidsClient(settings.secret_key, min_length=10)
-pwd_client = PwdClient()
+cursor_hasher = HashidsClient(f"{settings.secret_key}:cursor", min_length=10)
+pwd_client = PwdClient(
+    workers=settings.pwd.workers,
+    queue_size=settings.pwd.queue_size,
+    import_workers=settings.pwd.import_workers,
+    **settings.pwd.context_options,
+)
 mailsender: ABCMailSender = new_mailsender(
     smtp_server=settings.email.smtp_server,
     smtp_port=settings.email.smtp_port,
     address=settings.email.address,
     password=settings.email.password,
     fake=(not settings.email.is_configured),
+    pool_size=settings.email.pool_size,
+    start_tls=settings.email.start_tls,
+    timeout=settings.email.timeout,
+)
+ratelimit_redis = None
+if settings.ratelimit.use_redis:
+    from aioredis import from_url
+
+    ratelimit_redis = from_url(settings.redis.url)
+ip_rate_limiter = new_rate_limiter(
+    "ip",
+    rate=settings.ratelimit.ip_rate,
+    burst=settings.ratelimit.ip_burst,
+    redis=ratelimit_redis,
+    redis_limit=settings.ratelimit.ip_redis_limit,
+    redis_window=settings.ratelimit.redis_window,
+)
+email_rate_limiter = new_rate_limiter(
+    "email",
+    rate=settings.ratelimit.email_rate,
+    burst=settings.ratelimit.email_burst,
+    redis=ratelimit_redis,
+    redis_limit=settings.ratelimit.email_redis_limit,
+    redis_window=settings.ratelimit.redis_window,
 )
 google_sso = GoogleSSO(
     settings.auth.google_client_id,
@@ -50,26 +114,189 @@ google_sso = GoogleSSO(
 )
 
 
-def get_db_session():
+def forget_user(subject: str) -> None:
+    """Drop the cached user and pin their reads to the primary until replicas
+    have caught up with the change.
+    """
+    user_cache.delete(id_hasher.decode(subject))
+    write_pins.set(subject, True)
+
+
+@event.listens_for(Session, "after_commit")
+def forget_writer(session: Session) -> None:
+    # other workers learn about the change from `users_changed` a moment later
+    request: Request | None = session.info.get("request")
+    subject = getattr(request.state, "subject", None) if request else None
+    if subject:
+        forget_user(subject)
+
+
+user_listener = ChannelListener(
+    settings.pg.url,
+    "users_changed",
+    lambda user_id: forget_user(id_hasher.encode(int(user_id))),
+    # changes made while disconnected went unnoticed
+    on_connect=user_cache.clear,
+    connect_args=settings.pg.args,
+)
+
+
+def read_cached_token(
+    token: str, jwt_client: JWTClient, token_cache: TokenCache
+) -> TokenDataSchema:
+    payload = token_cache.get(token)
+    if payload is None:
+        payload = TokenDataSchema(**jwt_client.read_token(token))
+        token_cache.set(token, payload, payload.exp)
+    return payload
+
+
+async def read_cached_user(
+    user_id: int, user_domain: AsyncUserDomain, user_cache: TTLCache
+) -> Row:
+    user = user_cache.get(user_id)
+    if user is None:
+        generation = user_cache.generation
+        # None keeps the cache's own TTL
+        ttl: Optional[float] = None
+        try:
+            user = await user_domain.get_row_by_id(user_id, USER_FIELDS)
+        except DomainError:
+            user = MISSING_USER
+            ttl = settings.user_cache_missing_ttl
+        user_cache.set(user_id, user, ttl, generation)
+
+    if user is MISSING_USER:
+        raise DomainError("user_not_found")
+    return user
+
+
+def reads_own_writes(request: Request) -> bool:
+    """Whether reads of the request have to see the requester's recent writes.
+
+    True for a while after the requester wrote something or got their token
+    issued, replicas might not have caught up with the primary yet. Only the
+    payload `read_request_token` verified is looked at, requests that don't
+    authenticate go to a replica without their token being decoded.
+    """
+    payload: Optional[TokenDataSchema] = getattr(request.state, "token_payload", None)
+    if payload is None:
+        return False
+
+    if write_pins.get(payload.sub):
+        return True
+    return (
+        payload.iat is not None
+        and payload.iat > time.time() - settings.pg.read_your_writes
+    )
+
+
+def get_db_session(request: Request):
     session: Session = SessionLocal()
+    session.info["request"] = request
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+async def get_async_db_session(request: Request):
+    async with AsyncSessionLocal() as session:
+        session.info["request"] = request
+        yield session
+
+
+def get_read_db_session(request: Request):
+    """Session on a replica, or on the primary if none is usable"""
+    session: Optional[Session] = None
+    if replicas and not reads_own_writes(request):
+        session = replicas.open_session(SessionLocal)
+
+    session = session or SessionLocal()
     try:
         yield session
     finally:
         session.close()
 
 
+async def get_async_read_db_session(request: Request):
+    session: Optional[AsyncSession] = None
+    if async_replicas and not reads_own_writes(request):
+        session = await async_replicas.open_session(AsyncSessionLocal)
+
+    session = session or AsyncSessionLocal()
+    async with session:
+        yield session
+
+
 def get_user_repository(session: Session = Depends(get_db_session)):
     return UserRepository(session=session)
 
 
+def get_read_user_repository(session: Session = Depends(get_read_db_session)):
+    return UserRepository(session=session)
+
+
+def get_native_async_user_repository(
+    session: AsyncSession = Depends(get_async_db_session),
+) -> AsyncUserRepository:
+    return AsyncUserRepository(session=session)
+
+
+def get_threaded_user_repository(
+    user_repository: UserRepository = Depends(get_user_repository),
+) -> ThreadedUserRepository:
+    return ThreadedUserRepository(user_repository)
+
+
+def get_native_async_read_user_repository(
+    session: AsyncSession = Depends(get_async_read_db_session),
+) -> AsyncUserRepository:
+    return AsyncUserRepository(session=session)
+
+
+def get_threaded_read_user_repository(
+    user_repository: UserRepository = Depends(get_read_user_repository),
+) -> ThreadedUserRepository:
+    return ThreadedUserRepository(user_repository)
+
+
+get_async_user_repository = (
+    get_native_async_user_repository
+    if settings.pg.use_async
+    else get_threaded_user_repository
+)
+get_async_read_user_repository = (
+    get_native_async_read_user_repository
+    if settings.pg.use_async
+    else get_threaded_read_user_repository
+)
+
+
 def get_jwt_client() -> JWTClient:
     return jwt_client
 
 
+def get_token_cache() -> TokenCache:
+    return token_cache
+
+
+def get_count_cache() -> TTLCache:
+    return count_cache
+
+
+def get_user_cache() -> TTLCache:
+    return user_cache
+
+
 def get_id_hasher() -> HashidsClient:
     return id_hasher
 
 
+def get_cursor_hasher() -> HashidsClient:
+    return cursor_hasher
+
+
 def get_pwd_client() -> PwdClient:
     return pwd_client
 
@@ -82,39 +309,182 @@ def get_google_sso() -> GoogleSSO:
     return google_sso
 
 
+@lru_cache(maxsize=4)
+def parse_proxies(proxies: tuple[str, ...]) -> tuple[set[str], list[IPNetwork]]:
+    """Split `proxies` into host names and networks"""
+    names, networks = set(), []
+    for proxy in proxies:
+        try:
+            networks.append(ipaddress.ip_network(proxy, strict=False))
+        except ValueError:
+            names.add(proxy)
+    return names, networks
+
+
+def is_trusted_proxy(host: str) -> bool:
+    names, networks = parse_proxies(tuple(settings.ratelimit.trusted_proxies))
+    if host in names:
+        return True
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return any(address in network for network in networks)
+
+
+def client_address(request: Request) -> Optional[str]:
+    """Address of the client, looking through `trusted_proxies`.
+
+    Every proxy appends the address it got the request from to X-Forwarded-For,
+    so the rightmost one that isn't a trusted proxy is the client. Whatever is
+    left of it came from the client and could be made up.
+    """
+    if request.client is None:
+        return None
+    host = request.client.host
+    if not is_trusted_proxy(host):
+        return host
+
+    forwarded = ",".join(request.headers.getlist("X-Forwarded-For"))
+    for address in reversed([a.strip() for a in forwarded.split(",") if a.strip()]):
+        host = address
+        if not is_trusted_proxy(address):
+            break
+    return host
+
+
+async def limit_by_ip(request: Request) -> None:
+    """Throttle expensive auth endpoints per client before any hashing work"""
+    host = client_address(request)
+    if not settings.ratelimit.enabled or host is None:
+        return
+    try:
+        await ip_rate_limiter.hit(host)
+    except RateLimited as e:
+        logger.info(f"Rate limited {host} on {request.url.path}")
+        raise exceptions.TooManyRequests(retry_after=e.retry_after)
+
+
+async def limit_by_email(email: str) -> None:
+    if not settings.ratelimit.enabled:
+        return
+    try:
+        await email_rate_limiter.hit(email.lower())
+    except RateLimited as e:
+        logger.info(f"Rate limited attempts for {email}")
+        raise exceptions.TooManyRequests(retry_after=e.retry_after)
+
+
+# Route dependencies resolve before the endpoint's, so a rejected request
+# never checks out a DB connection. They share the endpoint's body fields.
+async def limit_signup_by_email(new_user: UserToCreateSchema) -> None:
+    await limit_by_email(new_user.email)
+
+
+async def limit_login_by_email(username: str = Form(...)) -> None:
+    await limit_by_email(username)
+
+
 def get_user_domain(
     user_repository: UserRepository = Depends(get_user_repository),
     id_hasher: HashidsClient = Depends(get_id_hasher),
     jwt_client: JWTClient = Depends(get_jwt_client),
     pwd_client: PwdClient = Depends(get_pwd_client),
+    count_cache: TTLCache = Depends(get_count_cache),
 ) -> UserDomain:
     return UserDomain(
         user_repository=user_repository,
         id_hasher=id_hasher,
         jwt_client=jwt_client,
         pwd_client=pwd_client,
+        count_cache=count_cache,
     )
 
 
-async def authenticate(
-    security_scopes: SecurityScopes,
+def get_read_user_domain(
+    user_repository: UserRepository = Depends(get_read_user_repository),
+    id_hasher: HashidsClient = Depends(get_id_hasher),
+    jwt_client: JWTClient = Depends(get_jwt_client),
+    pwd_client: PwdClient = Depends(get_pwd_client),
+    count_cache: TTLCache = Depends(get_count_cache),
+) -> UserDomain:
+    """User domain for read-only endpoints, served by a replica if possible"""
+    return UserDomain(
+        user_repository=user_repository,
+        id_hasher=id_hasher,
+        jwt_client=jwt_client,
+        pwd_client=pwd_client,
+        count_cache=count_cache,
+    )
+
+
+def get_async_user_domain(
+    user_repository: AsyncUserRepository
+    | ThreadedUserRepository = Depends(get_async_user_repository),
+    id_hasher: HashidsClient = Depends(get_id_hasher),
+    jwt_client: JWTClient = Depends(get_jwt_client),
+    pwd_client: PwdClient = Depends(get_pwd_client),
+) -> AsyncUserDomain:
+    return AsyncUserDomain(
+        user_repository=user_repository,
+        id_hasher=id_hasher,
+        jwt_client=jwt_client,
+        pwd_client=pwd_client,
+    )
+
+
+def get_async_read_user_domain(
+    user_repository: AsyncUserRepository
+    | ThreadedUserRepository = Depends(get_async_read_user_repository),
+    id_hasher: HashidsClient = Depends(get_id_hasher),
+    jwt_client: JWTClient = Depends(get_jwt_client),
+    pwd_client: PwdClient = Depends(get_pwd_client),
+) -> AsyncUserDomain:
+    return AsyncUserDomain(
+        user_repository=user_repository,
+        id_hasher=id_hasher,
+        jwt_client=jwt_client,
+        pwd_client=pwd_client,
+    )
+
+
+def read_request_token(
+    request: Request,
     token: str = Depends(oauth2_scheme),
     jwt_client: JWTClient = Depends(get_jwt_client),
+    token_cache: TokenCache = Depends(get_token_cache),
+) -> Optional[TokenDataSchema]:
+    """Verified payload of the bearer token, None if it's invalid.
+
+    Resolved ahead of the read session, so `reads_own_writes` can route by it.
+    """
+    try:
+        payload = read_cached_token(token, jwt_client, token_cache)
+    except InvalidToken as e:
+        logger.trace(f"Authentication failed with exception: {e}")
+        return None
+    request.state.token_payload = payload
+    return payload
+
+
+async def authenticate(
+    request: Request,
+    security_scopes: SecurityScopes,
+    payload: Optional[TokenDataSchema] = Depends(read_request_token),
     id_hasher: HashidsClient = Depends(get_id_hasher),
-    user_domain: UserDomain = Depends(get_user_domain),
+    user_domain: AsyncUserDomain = Depends(get_async_read_user_domain),
+    user_cache: TTLCache = Depends(get_user_cache),
 ) -> AuthenticatedUserSchema:
     if security_scopes.scopes:
         authenticate_value = f'Bearer scope="{security_scopes.scope_str}"'
     else:
         authenticate_value = "Bearer"
 
+    if payload is None:
+        raise exceptions.BadCredentials(headers={"WWW-Authenticate": authenticate_value})
     try:
-        payload = TokenDataSchema(**jwt_client.read_token(token))
         user_id = id_hasher.decode(payload.sub)
-        user = user_domain.get_by_id(user_id)
-    except JWTError as e:
-        logger.trace(f"Authentication failed with exception: {e}")
-        raise exceptions.BadCredentials(headers={"WWW-Authenticate": authenticate_value})
+        user = await read_cached_user(user_id, user_domain, user_cache)
     except DomainError:
         logger.trace(f"Authentication failed for unknown user {user_id}")
         raise exceptions.BadCredentials(headers={"WWW-Authenticate": authenticate_value})
@@ -125,4 +495,16 @@ async def authenticate(
             detail="Not enough permissions",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    # writes made on behalf of the user pin their reads to the primary
+    request.state.subject = payload.sub
     return AuthenticatedUserSchema(user=user, token_payload=payload)
+
+
+def authenticate_admin(
+    auth: AuthenticatedUserSchema = Security(
+        authenticate, scopes=[oauth2_scope.profile_read.name]
+    ),
+) -> AuthenticatedUserSchema:
+    if auth.user.email.lower() not in settings.auth.admin_emails:
+        raise exceptions.PermissionDenied("admin_only")
+    return auth
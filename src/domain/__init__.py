@@ -1,3 +1,5 @@
+import functools
+import inspect
 from abc import ABC
 
 from modules.hashid import HashidsClient
@@ -10,6 +12,63 @@ class ABCDomain(ABC):
     def __init__(self, id_hasher: HashidsClient, pwd_client: PwdClient):
         self.id_hasher = id_hasher
         self.pwd_client = pwd_client
+        self._depth = 0
+
+
+def domain_call(method, commit: bool):
+    """Wrap `method` so the outermost decorated call, optionally after
+    committing, hands the repository's connection back to the pool.
+
+    Closing the session rolls back whatever was left uncommitted, so a use
+    case that raises leaves nothing behind.
+    """
+    if inspect.iscoroutinefunction(method):
+
+        @functools.wraps(method)
+        async def async_wrapper(self, *args, **kwargs):
+            self._depth += 1
+            try:
+                result = await method(self, *args, **kwargs)
+                if commit and self._depth == 1:
+                    await self.repository.commit()
+                return result
+            finally:
+                self._depth -= 1
+                if self._depth == 0:
+                    await self.repository.release()
+
+        return async_wrapper
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        self._depth += 1
+        try:
+            result = method(self, *args, **kwargs)
+            if commit and self._depth == 1:
+                self.repository.commit()
+            return result
+        finally:
+            self._depth -= 1
+            if self._depth == 0:
+                self.repository.release()
+
+    return wrapper
+
+
+def releases_connection(method):
+    """Hand the repository's connection back to the pool once the outermost
+    domain call returns, instead of holding it until the response is sent.
+    """
+    return domain_call(method, commit=False)
+
+
+def unit_of_work(method):
+    """Like `releases_connection`, but the outermost call also commits.
+
+    Use cases calling each other share the outermost call's transaction, so
+    every use case commits exactly once.
+    """
+    return domain_call(method, commit=True)
 
 
 class DomainError(Exception):
@@ -1,12 +1,15 @@
+from concurrent.futures import Executor
 from datetime import datetime
+from typing import Iterator, Literal, Optional
+
 from pydantic import EmailStr
 
+from sqlalchemy.engine import Row
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm.exc import NoResultFound
 
-from jose.exceptions import JWTError, ExpiredSignatureError, JWTClaimsError
-
-from modules.jwt.client import JWTClient
+from modules.jwt import JWTClient, ExpiredToken, InvalidToken
+from modules.cache import TTLCache
 from modules.hashid import HashidsClient
 from modules.pwd import PwdClient
 
@@ -14,94 +17,229 @@ from schemas.auth import TokenDataSchema
 
 from settings import settings, oauth2_scope
 from repository.models import User, VerificationCode
-from repository.user import UserRepository
-from schemas.user import UserInDbSchema, UserToCreateSchema
+from repository.user import (
+    AsyncUserRepository,
+    ThreadedUserRepository,
+    UserRepository,
+)
+from schemas.user import UserSchema, UserToCreateSchema, UserToImportSchema
+
+from domain import ABCDomain, DomainError, releases_connection, unit_of_work
 
-from domain import ABCDomain, DomainError
 
+class BaseUserDomain(ABCDomain):
+    """Rules shared by the sync and async user domains.
+
+    Subclasses only differ in how they reach the repository and the pwd pool,
+    they pass what it returned to the methods below.
+    """
 
-class UserDomain(ABCDomain):
     model = User
+    # the second attempt sees a user created by a concurrent first login
+    sso_upsert_attempts = 2
 
     def __init__(
         self,
         id_hasher: HashidsClient,
         pwd_client: PwdClient,
-        user_repository: UserRepository,
         jwt_client: JWTClient,
     ):
         super().__init__(id_hasher, pwd_client)
-        self.repository = user_repository
         self.jwt_client = jwt_client
 
+    def make_token(self, user: User, type: str, scopes: list[str] = []) -> str:
+        # TODO переделать
+        try:
+            expiration_timedelta = getattr(settings.jwt, f"{type}_exp")
+        except AttributeError:
+            raise DomainError("invalid_token_type")
+
+        return self.jwt_client.create_token(
+            sub=self.id_hasher.encode(user.id),
+            exp=expiration_timedelta,
+            scopes=scopes,
+        )
+
+    def read_token(self, token: str) -> TokenDataSchema:
+        try:
+            return TokenDataSchema(**self.jwt_client.read_token(token))
+        except ExpiredToken:
+            raise DomainError("token_expired")
+        except InvalidToken:
+            raise DomainError("invalid_token")
+
+    def sso_access_token(self, user: User) -> str:
+        """Access token with the basic scopes every SSO login gets"""
+        return self.make_token(user, "access", settings.auth.basic_scopes)
+
+    def verification_token(self, user: User) -> str:
+        return self.make_token(
+            user, "verify_email", scopes=[oauth2_scope.profile_verify.name]
+        )
+
+    def new_user(self, user: UserToCreateSchema, password_hash: str) -> User:
+        return User(**{**user.dict(), "password": password_hash})
+
+    def check_verification_code(self, code: VerificationCode) -> None:
+        if code.expires_at < datetime.now(tz=code.expires_at.tzinfo):
+            raise DomainError("expired_verification_code")
+
+    def check_can_login(self, user: User) -> None:
+        if user.is_email_verified is False:
+            raise DomainError("invalid_credentials")
+
+
+class UserDomain(BaseUserDomain):
+    def __init__(
+        self,
+        id_hasher: HashidsClient,
+        pwd_client: PwdClient,
+        user_repository: UserRepository,
+        jwt_client: JWTClient,
+        count_cache: Optional[TTLCache] = None,
+    ):
+        super().__init__(id_hasher, pwd_client, jwt_client)
+        self.repository = user_repository
+        self.count_cache = count_cache
+
+    @releases_connection
     def get_by_id(self, user_id: int) -> User:
         try:
             return self.repository.get_by_id(user_id)
         except NoResultFound:
             raise DomainError("user_not_found")
 
+    @releases_connection
+    def get_row_by_id(self, user_id: int, fields: list[str]) -> Row:
+        try:
+            return self.repository.get_row_by_id(user_id, fields)
+        except NoResultFound:
+            raise DomainError("user_not_found")
+
+    @releases_connection
     def get_by_email(self, email: str) -> User:
         try:
             return self.repository.get_by_email(email)
         except NoResultFound:
             raise DomainError("user_not_found")
 
-    def fetch(self, filters: dict, page: int = 0, page_size: int = 20) -> list[User]:
-        offset = page * page_size
-        users = self.repository.fetch(filters, offset, page_size)
-        return users
+    @releases_connection
+    def fetch_rows(
+        self, filters: dict, page: int, page_size: int, fields: list[str]
+    ) -> list[Row]:
+        return self.repository.fetch_rows(filters, page * page_size, page_size, fields)
+
+    @releases_connection
+    def fetch_rows_after(
+        self, filters: dict, after_id: Optional[int], page_size: int, fields: list[str]
+    ) -> list[Row]:
+        return self.repository.fetch_rows_after(filters, after_id, page_size, fields)
+
+    @releases_connection
+    def search_rows(
+        self, email_prefix: str, filters: dict, limit: int, fields: list[str]
+    ) -> list[Row]:
+        return self.repository.search_rows(email_prefix, filters, limit, fields)
+
+    def stream(
+        self, filters: dict, fields: list[str], batch_size: int = 1000
+    ) -> Iterator[list[Row]]:
+        return self.repository.stream(filters, fields, batch_size)
 
+    @releases_connection
+    def count(
+        self,
+        filters: dict,
+        strategy: Literal["exact", "estimated", "cached"] = "exact",
+    ) -> int:
+        """Total users matching `filters`.
+
+        `estimated` comes from planner statistics and never scans the table,
+        `cached` is an exact count reused for the cache TTL per filter set.
+        """
+        if strategy == "estimated":
+            return self.repository.estimate_count(filters)
+        if strategy == "exact" or self.count_cache is None:
+            return self.repository.count(filters)
+
+        key = tuple(sorted(filters.items()))
+        count = self.count_cache.get(key)
+        if count is None:
+            count = self.repository.count(filters)
+            self.count_cache.set(key, count)
+        return count
+
+    @unit_of_work
     def signup(self, new_user: UserToCreateSchema) -> tuple[User, VerificationCode, str]:
         user = self.create(new_user)
         code = self.create_verification_code(user)
-        token = self.make_token(
-            user, "verify_email", scopes=[oauth2_scope.profile_verify.name]
-        )
-        return user, code, token
-
-    def signup_by_sso_provider(
-        self, provider_name: str, provider_id: str, email: EmailStr
-    ) -> tuple[User, str]:
-        try:
-            user, _ = self.repository.create_user_by_sso_provider(
-                provider_name, provider_id, email
-            )
-        except IntegrityError:
-            raise DomainError("user_already_exists_or_linked_by_provider")
-
-        return user, self.make_token(user, "access", settings.auth.basic_scopes)
+        return user, code, self.verification_token(user)
 
+    @unit_of_work
     def create(self, user: UserToCreateSchema) -> User:
-        user_to_create = user.dict()
-        user_to_create["password"] = self.pwd_client.get_password_hash(
-            user_to_create["password"]
-        )
+        password_hash = self.pwd_client.get_password_hash(user.password)
         try:
-            return self.repository.create_user(User(**user_to_create))
+            return self.repository.create_user(self.new_user(user, password_hash))
         except IntegrityError:
             raise DomainError("user_already_exists")
 
     def update(self, user: User) -> User:
         pass
 
+    @unit_of_work
+    def import_users(
+        self, users: list[UserToImportSchema], executor: Optional[Executor] = None
+    ) -> list[str]:
+        """Create `users` in one batch, hashing passwords on `executor`.
+
+        Returns emails that already existed or repeat within the batch.
+        """
+        taken = self.repository.existing_emails([user.email for user in users])
+        self.repository.release()
+
+        new_users: list[UserToImportSchema] = []
+        duplicates: list[str] = []
+        seen = set(taken)
+        for user in users:
+            if user.email in seen:
+                duplicates.append(user.email)
+            else:
+                new_users.append(user)
+                seen.add(user.email)
+
+        hashes = self.pwd_client.hash_many(
+            [user.password for user in new_users], executor
+        )
+        inserted = self.repository.copy_users(
+            [
+                (user.email, password, user.is_active, user.is_email_verified)
+                for user, password in zip(new_users, hashes)
+            ]
+        )
+        # an email can get taken by a concurrent signup while hashing
+        duplicates += [user.email for user in new_users if user.email not in inserted]
+        return duplicates
+
+    @unit_of_work
     def delete(self, user_id: int) -> None:
         self.repository.delete_user(user_id)
 
+    @unit_of_work
     def create_verification_code(self, user: User) -> VerificationCode:
         return self.repository.create_verification_code(
             user, settings.jwt.verify_email_exp
         )
 
-    def verify_email(self, user: UserInDbSchema, code: int):
+    @unit_of_work
+    def verify_email(self, user: UserSchema, code: int):
         try:
             code_obj = self.repository.get_verification_code(user.id, code)
         except NoResultFound:
             raise DomainError("verification_code_not_found")
-        if code_obj.expires_at < datetime.now(tz=code_obj.expires_at.tzinfo):
-            raise DomainError("expired_verification_code")
-
+        self.check_verification_code(code_obj)
         self.repository.use_verification_code(code_obj)
 
+    @unit_of_work
     def login(
         self, email: str, password: str, scopes: list[str] = []
     ) -> tuple[User, str]:
@@ -109,40 +247,132 @@ class UserDomain(ABCDomain):
             user = self.repository.get_by_email(email)
         except NoResultFound:
             raise DomainError("invalid_credentials")
+        self.check_can_login(user)
 
-        if (
-            user.is_email_verified is False
-            or self.pwd_client.verify_password(password, user.password) is False
-        ):
+        # don't hold a connection while the password is being hashed
+        self.repository.release()
+        verified, new_hash = self.pwd_client.verify_and_update_password(
+            password, user.password
+        )
+        if not verified:
             raise DomainError("invalid_credentials")
+        if new_hash:
+            self.repository.update_password(user.id, new_hash)
 
         return user, self.make_token(user, "access", scopes)
 
-    def login_by_sso_provider(self, id: str, name: str, email: str) -> tuple[User, str]:
+    @unit_of_work
+    def login_or_signup_by_sso_provider(
+        self, provider_name: str, provider_id: str, email: EmailStr
+    ) -> tuple[User, str]:
+        for _ in range(self.sso_upsert_attempts):
+            user = self.repository.upsert_user_by_sso_provider(
+                provider_name, provider_id, email
+            )
+            if user is not None:
+                return user, self.sso_access_token(user)
+        raise DomainError("user_already_exists_or_linked_by_provider")
+
+
+class AsyncUserDomain(BaseUserDomain):
+    """`UserDomain` for async endpoints. Password hashing runs on the pwd pool."""
+
+    def __init__(
+        self,
+        id_hasher: HashidsClient,
+        pwd_client: PwdClient,
+        user_repository: AsyncUserRepository | ThreadedUserRepository,
+        jwt_client: JWTClient,
+    ):
+        super().__init__(id_hasher, pwd_client, jwt_client)
+        self.repository = user_repository
+
+    @releases_connection
+    async def get_by_id(self, user_id: int) -> User:
         try:
-            user, _ = self.repository.get_by_sso_provider(id, name, email)
+            return await self.repository.get_by_id(user_id)
         except NoResultFound:
             raise DomainError("user_not_found")
 
-        return user, self.make_token(user, "access", settings.auth.basic_scopes)
+    @releases_connection
+    async def get_row_by_id(self, user_id: int, fields: list[str]) -> Row:
+        try:
+            return await self.repository.get_row_by_id(user_id, fields)
+        except NoResultFound:
+            raise DomainError("user_not_found")
 
-    def make_token(self, user: User, type: str, scopes: list[str] = []) -> str:
-        # TODO переделать
+    @releases_connection
+    async def get_by_email(self, email: str) -> User:
         try:
-            expiration_timedelta = getattr(settings.jwt, f"{type}_exp")
-        except AttributeError:
-            raise DomainError("invalid_token_type")
+            return await self.repository.get_by_email(email)
+        except NoResultFound:
+            raise DomainError("user_not_found")
 
-        return self.jwt_client.create_token(
-            sub=self.id_hasher.encode(user.id),
-            exp=expiration_timedelta,
-            scopes=scopes,
+    @unit_of_work
+    async def signup(
+        self, new_user: UserToCreateSchema
+    ) -> tuple[User, VerificationCode, str]:
+        user = await self.create(new_user)
+        code = await self.create_verification_code(user)
+        return user, code, self.verification_token(user)
+
+    @unit_of_work
+    async def create(self, user: UserToCreateSchema) -> User:
+        password_hash = await self.pwd_client.get_password_hash_async(user.password)
+        try:
+            return await self.repository.create_user(self.new_user(user, password_hash))
+        except IntegrityError:
+            raise DomainError("user_already_exists")
+
+    @unit_of_work
+    async def delete(self, user_id: int) -> None:
+        await self.repository.delete_user(user_id)
+
+    @unit_of_work
+    async def create_verification_code(self, user: User) -> VerificationCode:
+        return await self.repository.create_verification_code(
+            user, settings.jwt.verify_email_exp
         )
 
-    def read_token(self, token: str) -> TokenDataSchema:
+    @unit_of_work
+    async def verify_email(self, user: UserSchema, code: int):
         try:
-            return TokenDataSchema(**self.jwt_client.read_token(token))
-        except ExpiredSignatureError:
-            raise DomainError("token_expired")
-        except (JWTError, JWTClaimsError):
-            raise DomainError("invalid_token")
+            code_obj = await self.repository.get_verification_code(user.id, code)
+        except NoResultFound:
+            raise DomainError("verification_code_not_found")
+        self.check_verification_code(code_obj)
+        await self.repository.use_verification_code(code_obj)
+
+    @unit_of_work
+    async def login(
+        self, email: str, password: str, scopes: list[str] = []
+    ) -> tuple[User, str]:
+        try:
+            user = await self.repository.get_by_email(email)
+        except NoResultFound:
+            raise DomainError("invalid_credentials")
+        self.check_can_login(user)
+
+        # don't hold a connection while the password is being hashed
+        await self.repository.release()
+        verified, new_hash = await self.pwd_client.verify_and_update_password_async(
+            password, user.password
+        )
+        if not verified:
+            raise DomainError("invalid_credentials")
+        if new_hash:
+            await self.repository.update_password(user.id, new_hash)
+
+        return user, self.make_token(user, "access", scopes)
+
+    @unit_of_work
+    async def login_or_signup_by_sso_provider(
+        self, provider_name: str, provider_id: str, email: EmailStr
+    ) -> tuple[User, str]:
+        for _ in range(self.sso_upsert_attempts):
+            user = await self.repository.upsert_user_by_sso_provider(
+                provider_name, provider_id, email
+            )
+            if user is not None:
+                return user, self.sso_access_token(user)
+        raise DomainError("user_already_exists_or_linked_by_provider")
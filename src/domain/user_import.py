@@ -0,0 +1,131 @@
+"""Bulk user import from CSV (with an `email,password` header) or NDJSON.
+
+Optional `is_active` and `is_email_verified` columns default to true and false.
+
+    cd src && python -m domain.user_import users.csv --workers 8
+"""
+import argparse
+import contextlib
+import csv
+import json
+import sys
+import time
+from concurrent.futures import Executor
+from itertools import islice
+from typing import Iterable, Iterator, Literal, Optional
+
+from pydantic import ValidationError
+
+from domain.user import UserDomain
+from schemas.user import (
+    InvalidImportRecordSchema,
+    UserImportReportSchema,
+    UserToImportSchema,
+)
+
+
+ImportFormat = Literal["csv", "ndjson"]
+
+BATCH_SIZE = 1000
+
+
+def read_records(
+    lines: Iterable[str], format: ImportFormat
+) -> Iterator[tuple[int, dict]]:
+    """(line number, record) pairs, a record that can't be parsed is empty"""
+    if format == "csv":
+        reader = csv.DictReader(lines)
+        for record in reader:
+            # DictReader keeps the cells past the header under a None key
+            if None in record:
+                yield reader.line_num, {}
+                continue
+            # empty cells fall back to the schema defaults
+            yield reader.line_num, {k: v for k, v in record.items() if v}
+        return
+
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = {}
+        yield number, record if isinstance(record, dict) else {}
+
+
+def read_users(
+    lines: Iterable[str], format: ImportFormat, report: UserImportReportSchema
+) -> Iterator[UserToImportSchema]:
+    for number, record in read_records(lines, format):
+        try:
+            yield UserToImportSchema(**record)
+        except ValidationError as e:
+            report.invalid.append(
+                InvalidImportRecordSchema(line=number, error=str(e).replace("\n", " "))
+            )
+
+
+def import_users(
+    user_domain: UserDomain,
+    lines: Iterable[str],
+    format: ImportFormat = "csv",
+    batch_size: int = BATCH_SIZE,
+    executor: Optional[Executor] = None,
+) -> UserImportReportSchema:
+    report = UserImportReportSchema()
+    started_at = time.perf_counter()
+
+    users = read_users(lines, format, report)
+    while batch := list(islice(users, batch_size)):
+        duplicates = user_domain.import_users(batch, executor)
+        report.created += len(batch) - len(duplicates)
+        report.duplicates += duplicates
+
+    report.seconds = round(time.perf_counter() - started_at, 3)
+    total = report.created + len(report.duplicates) + len(report.invalid)
+    if report.seconds:
+        report.rows_per_second = round(total / report.seconds, 1)
+    return report
+
+
+def guess_format(filename: str) -> ImportFormat:
+    return "ndjson" if filename.endswith((".ndjson", ".jsonl")) else "csv"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path", help="file to import, - reads stdin")
+    parser.add_argument("--format", choices=["csv", "ndjson"])
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument(
+        "--workers", type=int, help="hashing processes, every core by default"
+    )
+    args = parser.parse_args()
+    format = args.format or guess_format(args.path)
+
+    from dependencies import id_hasher, jwt_client, pwd_client
+    from repository.database import SessionLocal
+    from repository.user import UserRepository
+
+    with contextlib.ExitStack() as stack:
+        session = stack.enter_context(contextlib.closing(SessionLocal()))
+        lines = (
+            sys.stdin
+            if args.path == "-"
+            else stack.enter_context(open(args.path, newline=""))
+        )
+        executor = stack.enter_context(pwd_client.new_executor(args.workers))
+        user_domain = UserDomain(
+            id_hasher=id_hasher,
+            pwd_client=pwd_client,
+            user_repository=UserRepository(session),
+            jwt_client=jwt_client,
+        )
+        report = import_users(user_domain, lines, format, args.batch_size, executor)
+
+    print(report.json(indent=2))
+
+
+if __name__ == "__main__":
+    main()
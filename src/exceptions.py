@@ -1,3 +1,4 @@
+import math
 from typing import Any, Optional
 from fastapi import HTTPException, status
 
@@ -38,3 +39,28 @@ class PermissionDenied(HTTPException):
         self, detail: Any = None, headers: Optional[dict[str, Any]] = None
     ) -> None:
         super().__init__(status.HTTP_403_FORBIDDEN, detail, headers)
+
+
+class Conflict(HTTPException):
+    def __init__(
+        self, detail: Any = None, headers: Optional[dict[str, Any]] = None
+    ) -> None:
+        super().__init__(status.HTTP_409_CONFLICT, detail, headers)
+
+
+class ServiceUnavailable(HTTPException):
+    def __init__(
+        self, detail: Any = None, headers: Optional[dict[str, Any]] = None
+    ) -> None:
+        super().__init__(status.HTTP_503_SERVICE_UNAVAILABLE, detail, headers)
+
+
+class TooManyRequests(HTTPException):
+    def __init__(
+        self, detail: Any = "too_many_requests", retry_after: float = 0
+    ) -> None:
+        super().__init__(
+            status.HTTP_429_TOO_MANY_REQUESTS,
+            detail,
+            {"Retry-After": str(math.ceil(retry_after))},
+        )
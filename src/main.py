@@ -2,10 +2,14 @@ import sys
 
 from loguru import logger
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse, ORJSONResponse
 from starlette.middleware.cors import CORSMiddleware
 
 from settings import settings
+from repository.database import async_engine, async_replicas
+from dependencies import get_mailsender, pwd_client, user_listener
 
+from api.middleware import QueryStatsMiddleware
 from api.router import router
 
 
@@ -23,7 +27,10 @@ if settings.log_file:
     )
 
 logger.info(f"Starting API server at http://{settings.host}:{settings.port}")
-app = FastAPI(title=settings.project_name)
+app = FastAPI(
+    title=settings.project_name,
+    default_response_class=ORJSONResponse if settings.fast_json else JSONResponse,
+)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=settings.allowed_origins,
@@ -31,6 +38,7 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(QueryStatsMiddleware)
 if settings.sentry_dsn:
     import sentry_sdk
     from sentry_sdk.integrations.asgi import SentryAsgiMiddleware
@@ -56,6 +64,35 @@ if settings.use_idempotency:
     )
 
 
+@app.on_event("shutdown")
+def shutdown_pwd_pool():
+    pwd_client.shutdown()
+
+
+@app.on_event("shutdown")
+async def close_smtp_connections():
+    await get_mailsender().close()
+
+
+if settings.user_cache_size:
+
+    @app.on_event("startup")
+    def start_user_listener():
+        user_listener.start()
+
+    @app.on_event("shutdown")
+    def stop_user_listener():
+        user_listener.stop()
+
+
+if async_engine is not None:
+
+    @app.on_event("shutdown")
+    async def dispose_async_engine():
+        await async_engine.dispose()
+        await async_replicas.dispose_async()
+
+
 app.include_router(
     router, prefix=f"/v{settings.api_version}", tags=[settings.api_version]
 )
@@ -1,32 +1,53 @@
+from functools import lru_cache
+from typing import Iterable
+
 from hashids import Hashids
 
 from .exceptions import InvalidHash, InvalidObjectWithID
 
 
 class HashidsClient:
-    def __init__(self, salt: str, min_length: int = 0):
+    """Hashids with a bounded memo of recently encoded and decoded ids"""
+
+    def __init__(self, salt: str, min_length: int = 0, cache_size: int = 65536):
         self.hashids = Hashids(salt, min_length=min_length)
+        self._encode = lru_cache(maxsize=cache_size)(self.hashids.encode)
+        self._decode = lru_cache(maxsize=cache_size)(self.hashids.decode)
 
     def encode(self, num: int) -> str:
-        return self.hashids.encode(num)
+        return self._encode(num)
 
     def decode(self, hash_id: str) -> int:
         try:
-            return self.hashids.decode(hash_id)[0]
+            return self._decode(hash_id)[0]
         except IndexError:
             raise InvalidHash()
 
-    def encode_obj(self, obj, fields: list[str] = ["id"]):
-        invalid_fields = []
-        try:
-            for field in fields:
-                setattr(obj, field, self.encode(getattr(obj, field)))
-        except AttributeError:
-            invalid_fields.append(field)
+    def encode_many(self, nums: Iterable[int]) -> list[str]:
+        return [self._encode(num) for num in nums]
 
-        if invalid_fields:
+    def decode_many(self, hash_ids: Iterable[str]) -> list[int]:
+        return [self.decode(hash_id) for hash_id in hash_ids]
+
+    def project_one(
+        self, row, fields: Iterable[str], id_fields: Iterable[str] = ("id",)
+    ) -> dict:
+        """Read `fields` of an ORM object or row into a dict with `id_fields` encoded.
+
+        The row itself is left untouched.
+        """
+        try:
+            data = {field: getattr(row, field) for field in fields}
+            for field in id_fields:
+                data[field] = self._encode(getattr(row, field))
+        except AttributeError as e:
             raise InvalidObjectWithID(
-                f"{obj} doesn't have required attributes to be hashed: {invalid_fields}"
+                f"{row} doesn't have required attributes to be hashed: {e}"
             )
+        return data
 
-        return obj
+    def project(
+        self, rows: Iterable, fields: Iterable[str], id_fields: Iterable[str] = ("id",)
+    ) -> list[dict]:
+        fields, id_fields = list(fields), list(id_fields)
+        return [self.project_one(row, fields, id_fields) for row in rows]
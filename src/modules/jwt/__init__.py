@@ -1 +1,3 @@
-from .client import JWTClient
+from .client import JWTClient, VerifyKey
+from .cache import TokenCache
+from .exceptions import InvalidToken, ExpiredToken
@@ -0,0 +1,129 @@
+from abc import ABC, abstractmethod
+from typing import Any, Optional
+
+from cryptography.hazmat.primitives import serialization
+from jose import jwk, jwt
+from jose.exceptions import ExpiredSignatureError, JWTError
+
+from .exceptions import ExpiredToken, InvalidToken
+
+
+REQUIRED_CLAIMS = ["exp", "sub"]
+
+
+class ABCJWTBackend(ABC):
+    """Signs and verifies tokens with key objects loaded by the same backend"""
+
+    algorithms: tuple[str, ...]
+
+    def check_algorithm(self, algorithm: str) -> None:
+        if algorithm not in self.algorithms:
+            raise ValueError(
+                f"{type(self).__name__} doesn't support {algorithm}, "
+                f"use one of {self.algorithms}"
+            )
+
+    @abstractmethod
+    def load_private_key(self, pem: str, algorithm: str) -> Any:
+        pass
+
+    @abstractmethod
+    def load_public_key(self, pem: str, algorithm: str) -> Any:
+        pass
+
+    @abstractmethod
+    def get_kid(self, token: str) -> Optional[str]:
+        """Read `kid` from the unverified header"""
+
+    @abstractmethod
+    def encode(self, data: dict, key: Any, algorithm: str, kid: str) -> str:
+        pass
+
+    @abstractmethod
+    def decode(self, token: str, key: Any, algorithm: str) -> dict:
+        pass
+
+
+class JoseBackend(ABCJWTBackend):
+    algorithms = ("RS256", "ES256")
+
+    def load_private_key(self, pem: str, algorithm: str) -> Any:
+        self.check_algorithm(algorithm)
+        return jwk.construct(pem, algorithm)
+
+    def load_public_key(self, pem: str, algorithm: str) -> Any:
+        self.check_algorithm(algorithm)
+        return jwk.construct(pem, algorithm)
+
+    def get_kid(self, token: str) -> Optional[str]:
+        try:
+            return jwt.get_unverified_header(token).get("kid")
+        except JWTError as e:
+            raise InvalidToken(str(e))
+
+    def encode(self, data: dict, key: Any, algorithm: str, kid: str) -> str:
+        return jwt.encode(data, key, algorithm=algorithm, headers={"kid": kid})
+
+    def decode(self, token: str, key: Any, algorithm: str) -> dict:
+        try:
+            return jwt.decode(
+                token,
+                key,
+                algorithms=algorithm,
+                options={f"require_{claim}": True for claim in REQUIRED_CLAIMS},
+            )
+        except ExpiredSignatureError as e:
+            raise ExpiredToken(str(e))
+        except JWTError as e:
+            raise InvalidToken(str(e))
+
+
+class PyJWTBackend(ABCJWTBackend):
+    """PyJWT on top of `cryptography` key objects. Requires the `pyjwt` package."""
+
+    algorithms = ("RS256", "ES256", "EdDSA")
+
+    def __init__(self) -> None:
+        import jwt as pyjwt
+
+        self.jwt = pyjwt
+
+    def load_private_key(self, pem: str, algorithm: str) -> Any:
+        self.check_algorithm(algorithm)
+        return serialization.load_pem_private_key(pem.encode(), password=None)
+
+    def load_public_key(self, pem: str, algorithm: str) -> Any:
+        self.check_algorithm(algorithm)
+        return serialization.load_pem_public_key(pem.encode())
+
+    def get_kid(self, token: str) -> Optional[str]:
+        try:
+            return self.jwt.get_unverified_header(token).get("kid")
+        except self.jwt.PyJWTError as e:
+            raise InvalidToken(str(e))
+
+    def encode(self, data: dict, key: Any, algorithm: str, kid: str) -> str:
+        return self.jwt.encode(data, key, algorithm=algorithm, headers={"kid": kid})
+
+    def decode(self, token: str, key: Any, algorithm: str) -> dict:
+        try:
+            return self.jwt.decode(
+                token,
+                key,
+                algorithms=[algorithm],
+                options={"require": REQUIRED_CLAIMS},
+            )
+        except self.jwt.ExpiredSignatureError as e:
+            raise ExpiredToken(str(e))
+        except self.jwt.PyJWTError as e:
+            raise InvalidToken(str(e))
+
+
+BACKENDS: dict[str, type[ABCJWTBackend]] = {
+    "jose": JoseBackend,
+    "pyjwt": PyJWTBackend,
+}
+
+
+def new_backend(name: str) -> ABCJWTBackend:
+    return BACKENDS[name]()
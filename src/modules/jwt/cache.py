@@ -0,0 +1,35 @@
+import hashlib
+import time
+from typing import Any, Optional
+
+from modules.cache import TTLCache
+
+
+class TokenCache(TTLCache):
+    """Bounded LRU of verified token payloads.
+
+    Entries are keyed by a digest of the raw token and expire at the token's own
+    `exp`, so a cached payload is never served after the token itself would have
+    failed verification.
+    """
+
+    # `exp` is a wall clock time
+    clock = staticmethod(time.time)
+
+    def __init__(self, maxsize: int = 4096):
+        super().__init__(maxsize=maxsize)
+
+    @staticmethod
+    def make_key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    # takes raw tokens and their `exp` instead of keys and TTLs
+    def get(  # type: ignore[override]
+        self, token: str, default: Any = None
+    ) -> Optional[Any]:
+        return super().get(self.make_key(token), default)
+
+    def set(  # type: ignore[override]
+        self, token: str, payload: Any, expires_at: float
+    ) -> None:
+        super().set(self.make_key(token), payload, ttl=expires_at - self.clock())
@@ -1,6 +1,16 @@
 from datetime import datetime, timedelta
+from typing import Any, NamedTuple
 
-from jose import jwt
+from .backends import ABCJWTBackend, new_backend
+from .exceptions import InvalidToken
+
+
+class VerifyKey(NamedTuple):
+    """Public key that is still accepted for tokens issued under `kid`"""
+
+    kid: str
+    algorithm: str
+    public_key: str
 
 
 class JWTClient:
@@ -8,11 +18,30 @@ class JWTClient:
         self,
         private_key: str,
         public_key: str,
-        algorithm: str | list[str],
+        algorithm: str,
+        backend: str = "jose",
+        kid: str = "primary",
+        verify_keys: list[VerifyKey] = [],
+        legacy_kid: str = "",
     ):
-        self.private_key = private_key
-        self.public_key = public_key
         self.algorithm = algorithm
+        self.kid = kid
+        # tokens issued before `kid` headers were introduced carry none
+        self.legacy_kid = legacy_kid or kid
+        self.backend: ABCJWTBackend = new_backend(backend)
+
+        self.private_key = None
+        if private_key:
+            self.private_key = self.backend.load_private_key(private_key, algorithm)
+        self.public_keys: dict[str, tuple[Any, str]] = {}
+        if public_key:
+            self.add_verify_key(VerifyKey(kid, algorithm, public_key))
+        for verify_key in verify_keys:
+            self.add_verify_key(verify_key)
+
+    def add_verify_key(self, verify_key: VerifyKey) -> None:
+        key = self.backend.load_public_key(verify_key.public_key, verify_key.algorithm)
+        self.public_keys[verify_key.kid] = (key, verify_key.algorithm)
 
     def create_token(
         self,
@@ -20,24 +49,19 @@ class JWTClient:
         exp: timedelta,
         scopes: list[str] = [],
     ) -> str:
-        return self.encode(
-            {"sub": sub, "exp": datetime.utcnow() + exp, "scopes": scopes}
-        )
+        now = datetime.utcnow()
+        return self.encode({"sub": sub, "iat": now, "exp": now + exp, "scopes": scopes})
 
     def read_token(self, token: str) -> dict:
         return self.decode(token)
 
     def encode(self, data: dict) -> str:
-        return jwt.encode(data, self.private_key, algorithm=self.algorithm)
-
-    def decode(self, token: str, **kwargs) -> dict:
-        return jwt.decode(
-            token,
-            self.public_key,
-            algorithms=self.algorithm,
-            options={
-                "require_exp": True,
-                "require_sub": True,
-            },
-            **kwargs
-        )
+        return self.backend.encode(data, self.private_key, self.algorithm, self.kid)
+
+    def decode(self, token: str) -> dict:
+        kid = self.backend.get_kid(token) or self.legacy_kid
+        try:
+            key, algorithm = self.public_keys[kid]
+        except KeyError:
+            raise InvalidToken(f"unknown key id: {kid}")
+        return self.backend.decode(token, key, algorithm)
@@ -1,7 +1,15 @@
+import asyncio
+import ssl
 from abc import ABC, abstractmethod
+from email.message import EmailMessage
+from typing import Optional
+
+import aiosmtplib
+from loguru import logger
 
-import ssl
-import smtplib
+
+# errors after which a pooled connection is replaced and the message resent
+DISCONNECTED = (aiosmtplib.SMTPServerDisconnected, ConnectionError)
 
 
 class ABCMailSender(ABC):
@@ -12,29 +20,138 @@ class ABCMailSender(ABC):
         self.password = password
 
     @abstractmethod
-    def send(self, recipient_email: str, subject: str, body: str) -> None:
+    async def send(self, recipient_email: str, subject: str, body: str) -> None:
         pass
 
+    async def close(self) -> None:
+        pass
+
+    def stats(self) -> dict:
+        return {}
+
+    def make_message(
+        self, recipient_email: str, subject: str, body: str
+    ) -> EmailMessage:
+        message = EmailMessage()
+        message["From"] = self.address
+        message["To"] = recipient_email
+        message["Subject"] = subject
+        message.set_content(body)
+        return message
+
 
 class MailSenderClient(ABCMailSender):
-    def send(self, recipient_email: str, subject: str, body: str) -> None:
-        context = ssl.create_default_context()
-        server = smtplib.SMTP(self.smtp_server, self.smtp_port)
-        server.starttls(context=context)
-        server.login(self.address, self.password)
-        message = f"Subject: {subject}\n\n{body}"
-        server.sendmail(self.address, recipient_email, message)
+    """Sends over up to `pool_size` persistent, logged in SMTP connections.
+
+    A send waits for a free connection, so at most `pool_size` messages are in
+    flight. Connections are opened on demand and kept between sends, one the
+    server dropped is replaced and the message resent once.
+    """
+
+    def __init__(
+        self,
+        smtp_server: str,
+        smtp_port: int,
+        address: str,
+        password: str,
+        pool_size: int = 4,
+        start_tls: bool = True,
+        timeout: float = 30,
+        tls_context: Optional[ssl.SSLContext] = None,
+    ):
+        super().__init__(smtp_server, smtp_port, address, password)
+        self.pool_size = pool_size
+        self.start_tls = start_tls
+        self.timeout = timeout
+        self.tls_context = tls_context or ssl.create_default_context()
+
+        # bound to the event loop that sends, `close` lets another loop start over
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._idle: list[aiosmtplib.SMTP] = []
+
+        self.sent = 0
+        self.connects = 0
+        self.reconnects = 0
+
+    async def send(self, recipient_email: str, subject: str, body: str) -> None:
+        message = self.make_message(recipient_email, subject, body)
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.pool_size)
+
+        async with self._slots:
+            for retry in (True, False):
+                if retry and self._idle:
+                    connection = self._idle.pop()
+                else:
+                    connection = await self._connect()
+                try:
+                    await connection.send_message(message)
+                except DISCONNECTED as e:
+                    connection.close()
+                    if not retry:
+                        raise
+                    self.reconnects += 1
+                    logger.info(f"SMTP connection lost, reconnecting: {e}")
+                    continue
+                except BaseException:
+                    connection.close()
+                    raise
+
+                self._idle.append(connection)
+                self.sent += 1
+                return
+
+    async def _connect(self) -> aiosmtplib.SMTP:
+        connection = aiosmtplib.SMTP(
+            hostname=self.smtp_server,
+            port=self.smtp_port,
+            start_tls=self.start_tls,
+            tls_context=self.tls_context,
+            timeout=self.timeout,
+        )
+        await connection.connect()
+        try:
+            if self.password:
+                await connection.login(self.address, self.password)
+        except BaseException:
+            connection.close()
+            raise
+        self.connects += 1
+        return connection
+
+    async def close(self) -> None:
+        """QUIT every idle connection"""
+        idle, self._idle, self._slots = self._idle, [], None
+        for connection in idle:
+            try:
+                await connection.quit()
+            except (aiosmtplib.SMTPException, OSError):
+                connection.close()
+
+    def stats(self) -> dict:
+        return {
+            "pool_size": self.pool_size,
+            "idle": len(self._idle),
+            "sent": self.sent,
+            "connects": self.connects,
+            "reconnects": self.reconnects,
+        }
 
 
 class FakeMailSender(ABCMailSender):
-    def send(self, recipient_email: str, subject: str, body: str) -> None:
+    async def send(self, recipient_email: str, subject: str, body: str) -> None:
         pass
 
 
 def new_mailsender(
-    smtp_server: str, smtp_port: int, address: str, password: str, fake: bool = False
+    smtp_server: str,
+    smtp_port: int,
+    address: str,
+    password: str,
+    fake: bool = False,
+    **options,
 ) -> ABCMailSender:
     if fake:
         return FakeMailSender(smtp_server, smtp_port, address, password)
     else:
-        return MailSenderClient(smtp_server, smtp_port, address, password)
+        return MailSenderClient(smtp_server, smtp_port, address, password, **options)
@@ -1 +1,2 @@
 from .client import PwdClient
+from .exceptions import PwdImportBusy, PwdPoolSaturated
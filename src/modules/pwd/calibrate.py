@@ -0,0 +1,67 @@
+"""Pick hashing costs that take about `--target-ms` on this machine.
+
+    cd src && python -m modules.pwd.calibrate --target-ms 250
+
+Run it on the hardware (or pod size) the API runs on and copy the printed
+variables into its environment.
+"""
+import argparse
+import time
+from typing import Any
+
+from .client import new_pwd_context
+
+
+def measure_ms(samples: int = 3, **context_options) -> float:
+    context = new_pwd_context(**context_options)
+    timings = []
+    for _ in range(samples):
+        started_at = time.perf_counter()
+        context.hash("calibration-password")
+        timings.append(time.perf_counter() - started_at)
+    return min(timings) * 1000
+
+
+def calibrate_argon2(
+    target_ms: float, memory_cost: int, parallelism: int
+) -> dict[str, Any]:
+    options: dict[str, Any] = {
+        "scheme": "argon2",
+        "argon2_memory_cost": memory_cost,
+        "argon2_parallelism": parallelism,
+        "argon2_time_cost": 1,
+    }
+    # time cost scales linearly, so step up until the target is reached
+    while measure_ms(**options) < target_ms:
+        options["argon2_time_cost"] += 1
+    return options
+
+
+def calibrate_bcrypt(target_ms: float) -> dict[str, Any]:
+    options: dict[str, Any] = {"scheme": "bcrypt", "bcrypt_rounds": 4}
+    # every extra round doubles the cost
+    while options["bcrypt_rounds"] < 31 and measure_ms(**options) < target_ms:
+        options["bcrypt_rounds"] += 1
+    return options
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--target-ms", type=float, default=250)
+    parser.add_argument("--scheme", choices=["argon2", "bcrypt"], default="argon2")
+    parser.add_argument("--memory-cost", type=int, default=19456, help="argon2, KiB")
+    parser.add_argument("--parallelism", type=int, default=1, help="argon2 lanes")
+    args = parser.parse_args()
+
+    if args.scheme == "argon2":
+        options = calibrate_argon2(args.target_ms, args.memory_cost, args.parallelism)
+    else:
+        options = calibrate_bcrypt(args.target_ms)
+
+    print(f"# {measure_ms(**options):.0f} ms per hash")
+    for name, value in options.items():
+        print(f"API_PWD_{name.upper()}={value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,231 @@
+import asyncio
+import contextlib
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+from functools import partial
+from typing import Callable, Iterator, Optional
+
 from passlib.context import CryptContext
 from passlib.exc import UnknownHashError
 
+from .exceptions import PwdImportBusy, PwdPoolSaturated
+
+
+SCHEMES = ("argon2", "bcrypt")
+
+
+def new_pwd_context(
+    scheme: str = "argon2",
+    argon2_memory_cost: int = 19456,
+    argon2_time_cost: int = 2,
+    argon2_parallelism: int = 1,
+    bcrypt_rounds: int = 12,
+) -> CryptContext:
+    """Hash with `scheme`; every other scheme or cost is deprecated and rehashed"""
+    return CryptContext(
+        schemes=[scheme, *(name for name in SCHEMES if name != scheme)],
+        deprecated="auto",
+        argon2__type="ID",
+        argon2__memory_cost=argon2_memory_cost,
+        argon2__rounds=argon2_time_cost,
+        argon2__parallelism=argon2_parallelism,
+        bcrypt__rounds=bcrypt_rounds,
+    )
+
+
+# settings of a pool worker process, `configure` runs when the worker starts.
+# Only functions sent to the worker use it, every `PwdClient` has its own.
+worker_context = new_pwd_context()
+
+
+def configure(context_options: dict) -> None:
+    global worker_context
+    worker_context = new_pwd_context(**context_options)
+
+
+def verify_password(
+    plain_password: str, hashed_password: str, context: Optional[CryptContext] = None
+) -> bool:
+    try:
+        return (context or worker_context).verify(plain_password, hashed_password)
+    except UnknownHashError:
+        return False
+
+
+def verify_and_update_password(
+    plain_password: str, hashed_password: str, context: Optional[CryptContext] = None
+) -> tuple[bool, Optional[str]]:
+    """Verify and return a new hash if the stored one uses outdated parameters"""
+    try:
+        return (context or worker_context).verify_and_update(
+            plain_password, hashed_password
+        )
+    except UnknownHashError:
+        return False, None
+
+
+def get_password_hash(password: str, context: Optional[CryptContext] = None) -> str:
+    return (context or worker_context).hash(password)
+
+
+class HashMetrics:
+    def __init__(self) -> None:
+        self.count = 0
+        self.rejected = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.count += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+
+    def stats(self) -> dict:
+        return {
+            "count": self.count,
+            "rejected": self.rejected,
+            "avg_ms": self.total_seconds / self.count * 1000 if self.count else 0.0,
+            "max_ms": self.max_seconds * 1000,
+        }
+
 
 class PwdClient:
-    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    """Password hashing.
+
+    The sync methods hash inline. The async ones run on a dedicated process pool
+    of `workers` processes (the default threadpool when `workers` is 0) and admit
+    at most `queue_size` calls waiting for a free worker; beyond that they fail
+    fast with `PwdPoolSaturated`. Bulk imports share a second pool of
+    `import_workers` processes, see `importing`. `context_options` go to
+    `new_pwd_context`.
+    """
+
+    def __init__(
+        self,
+        workers: int = 0,
+        queue_size: int = 16,
+        import_workers: int = 1,
+        **context_options,
+    ):
+        self.context_options = context_options
+        self.pwd_context = new_pwd_context(**context_options)
+        self.workers = workers
+        self.max_pending = workers + queue_size
+        self.pending = 0
+        self.metrics = HashMetrics()
+        self.executor: Optional[Executor] = None
+        self.import_workers = import_workers
+        self.import_executor: Optional[Executor] = None
+        self._import_lock = threading.Lock()
 
     def verify_password(self, plain_password: str, hashed_password: str) -> bool:
-        try:
-            return self.pwd_context.verify(plain_password, hashed_password)
-        except UnknownHashError:
-            return False
+        return verify_password(plain_password, hashed_password, self.pwd_context)
+
+    def verify_and_update_password(
+        self, plain_password: str, hashed_password: str
+    ) -> tuple[bool, Optional[str]]:
+        return verify_and_update_password(
+            plain_password, hashed_password, self.pwd_context
+        )
 
     def get_password_hash(self, password: str) -> str:
-        return self.pwd_context.hash(password)
+        return get_password_hash(password, self.pwd_context)
+
+    async def verify_password_async(
+        self, plain_password: str, hashed_password: str
+    ) -> bool:
+        return await self.submit(verify_password, plain_password, hashed_password)
+
+    async def verify_and_update_password_async(
+        self, plain_password: str, hashed_password: str
+    ) -> tuple[bool, Optional[str]]:
+        return await self.submit(
+            verify_and_update_password, plain_password, hashed_password
+        )
+
+    async def get_password_hash_async(self, password: str) -> str:
+        return await self.submit(get_password_hash, password)
+
+    def hash_many(
+        self, passwords: list[str], executor: Optional[Executor] = None
+    ) -> list[str]:
+        """Hash `passwords` spread over the workers of an executor from
+        `new_executor`, inline without one.
+        """
+        if executor is None:
+            return [self.get_password_hash(password) for password in passwords]
+        chunksize = max(len(passwords) // (4 * (os.cpu_count() or 1)), 1)
+        return list(executor.map(get_password_hash, passwords, chunksize=chunksize))
+
+    async def submit(self, func: Callable, *args):
+        if self.pending >= self.max_pending:
+            self.metrics.rejected += 1
+            raise PwdPoolSaturated()
+
+        self.pending += 1
+        started_at = time.perf_counter()
+        try:
+            executor = self.get_executor()
+            if executor is None:
+                # the default threadpool runs in this process, not in a worker
+                func = partial(func, context=self.pwd_context)
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(executor, func, *args)
+        finally:
+            self.pending -= 1
+            self.metrics.observe(time.perf_counter() - started_at)
+
+    def get_executor(self) -> Optional[Executor]:
+        if self.workers and self.executor is None:
+            self.executor = self.new_executor(self.workers)
+        return self.executor
+
+    @contextlib.contextmanager
+    def importing(self) -> Iterator[Executor]:
+        """The import pool, started on first use and kept for later imports.
+
+        Only one import hashes at a time, another one fails fast with
+        `PwdImportBusy` instead of queueing behind it.
+        """
+        if not self._import_lock.acquire(blocking=False):
+            raise PwdImportBusy()
+        try:
+            if self.import_executor is None:
+                self.import_executor = self.new_executor(self.import_workers)
+            yield self.import_executor
+        finally:
+            self._import_lock.release()
+
+    def new_executor(self, workers: Optional[int] = None) -> ProcessPoolExecutor:
+        """Process pool hashing with this client's settings, one worker per core
+        by default. The caller shuts it down.
+        """
+        # spawn: forking a process that runs an event loop and threads isn't safe
+        return ProcessPoolExecutor(
+            workers or os.cpu_count(),
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=configure,
+            initargs=(self.context_options,),
+        )
+
+    def shutdown(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+        if self.import_executor is not None:
+            self.import_executor.shutdown(wait=False, cancel_futures=True)
+            self.import_executor = None
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "pending": self.pending,
+            "queue_depth": max(self.pending - self.workers, 0),
+            "max_pending": self.max_pending,
+            "import_workers": self.import_workers,
+            "importing": self._import_lock.locked(),
+            "hash_latency": self.metrics.stats(),
+        }
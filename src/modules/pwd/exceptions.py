@@ -0,0 +1,8 @@
+
+
+class PwdPoolSaturated(Exception):
+    pass
+
+
+class PwdImportBusy(Exception):
+    pass
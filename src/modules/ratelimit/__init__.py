@@ -0,0 +1,7 @@
+from .client import (
+    RateLimiter,
+    RedisSlidingWindowLimiter,
+    TokenBucketLimiter,
+    new_rate_limiter,
+)
+from .exceptions import RateLimited
@@ -0,0 +1,113 @@
+import time
+import uuid
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Optional
+
+from loguru import logger
+
+from .exceptions import RateLimited
+
+
+class TokenBucketLimiter:
+    """In-process token buckets, one per key, refilled at `rate` tokens a second.
+
+    At most `maxsize` buckets are tracked; the least recently used are dropped,
+    which only ever errs towards letting a request through.
+    """
+
+    def __init__(self, rate: float, burst: int, maxsize: int = 65536):
+        self.rate = rate
+        self.burst = burst
+        self.maxsize = maxsize
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+        self._lock = Lock()
+
+    def hit(self, key: str) -> float:
+        """Take a token, return 0 or the seconds until one is available"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(key, (float(self.burst), now))
+            tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+            if tokens >= 1:
+                tokens -= 1
+                retry_after = 0.0
+            else:
+                retry_after = (1 - tokens) / self.rate
+
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        return retry_after
+
+    def clear(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+
+
+class RedisSlidingWindowLimiter:
+    """At most `limit` hits per `window` seconds per key, shared by every worker"""
+
+    def __init__(self, redis: Any, limit: int, window: int, prefix: str):
+        self.redis = redis
+        self.limit = limit
+        self.window = window
+        self.prefix = prefix
+
+    async def hit(self, key: str) -> float:
+        redis_key = f"ratelimit:{self.prefix}:{key}"
+        now = time.time()
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.zremrangebyscore(redis_key, 0, now - self.window)
+            pipe.zadd(redis_key, {f"{now}:{uuid.uuid4().hex}": now})
+            pipe.zcard(redis_key)
+            pipe.zrange(redis_key, 0, 0, withscores=True)
+            pipe.expire(redis_key, self.window)
+            _, _, count, oldest, _ = await pipe.execute()
+
+        if count <= self.limit:
+            return 0.0
+        return max(oldest[0][1] + self.window - now, 0.0)
+
+
+class RateLimiter:
+    """Checks the in-process tier first, then the shared one when configured"""
+
+    def __init__(
+        self,
+        local: TokenBucketLimiter,
+        shared: Optional[RedisSlidingWindowLimiter] = None,
+    ):
+        self.local = local
+        self.shared = shared
+        self.rejected = 0
+
+    async def hit(self, key: str) -> None:
+        retry_after = self.local.hit(key)
+        if not retry_after and self.shared is not None:
+            try:
+                retry_after = await self.shared.hit(key)
+            except Exception as e:
+                # an unavailable redis must not lock everybody out
+                logger.warning(f"Shared rate limit check failed: {e}")
+
+        if retry_after:
+            self.rejected += 1
+            raise RateLimited(retry_after)
+
+    def clear(self) -> None:
+        self.local.clear()
+
+
+def new_rate_limiter(
+    prefix: str,
+    rate: float,
+    burst: int,
+    redis: Any = None,
+    redis_limit: int = 0,
+    redis_window: int = 60,
+) -> RateLimiter:
+    shared = None
+    if redis is not None:
+        shared = RedisSlidingWindowLimiter(redis, redis_limit, redis_window, prefix)
+    return RateLimiter(TokenBucketLimiter(rate, burst), shared)
@@ -1,8 +1,30 @@
 from abc import ABC
 
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 
 class ABCReposotory(ABC):
     def __init__(self, session: Session) -> None:
         self.session = session
+
+    def commit(self) -> None:
+        self.session.commit()
+
+    def release(self) -> None:
+        """End the session's transaction and return its connection to the pool.
+
+        Loaded objects stay readable, the next query checks out a connection again.
+        """
+        self.session.close()
+
+
+class ABCAsyncRepository(ABC):
+    def __init__(self, session: AsyncSession) -> None:
+        self.session = session
+
+    async def commit(self) -> None:
+        await self.session.commit()
+
+    async def release(self) -> None:
+        await self.session.close()
@@ -1,11 +1,72 @@
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 
 from settings import settings
+from . import queries  # noqa: F401 registers statement counting for every engine
+from .pool import InstrumentedAsyncQueuePool, InstrumentedQueuePool
+from .replicas import AsyncReplicaSet, ReplicaSet
 
 
-engine = create_engine(settings.pg.url, connect_args=settings.pg.args)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+def pool_options(use_async: bool = False) -> dict:
+    if settings.pg.null_pool:
+        return {"poolclass": NullPool}
+    return {
+        "poolclass": InstrumentedAsyncQueuePool if use_async else InstrumentedQueuePool,
+        "pool_size": settings.pg.pool_size,
+        "max_overflow": settings.pg.max_overflow,
+        "pool_timeout": settings.pg.pool_timeout,
+        "pool_recycle": settings.pg.pool_recycle,
+        "pool_pre_ping": settings.pg.pool_pre_ping,
+    }
+
+
+engine = create_engine(
+    settings.pg.url, connect_args=settings.pg.args, **pool_options()
+)
+# sessions are released after every domain call, objects returned from it have
+# to stay readable without refreshing them on a new connection
+SessionLocal = sessionmaker(
+    autocommit=False, autoflush=False, expire_on_commit=False, bind=engine
+)
+
+# asyncpg is only required when the async path is enabled
+async_engine = (
+    create_async_engine(
+        settings.pg.async_url,
+        connect_args=settings.pg.async_args,
+        **pool_options(use_async=True),
+    )
+    if settings.pg.use_async
+    else None
+)
+AsyncSessionLocal = sessionmaker(  # type: ignore[type-var]
+    autocommit=False,
+    autoflush=False,
+    expire_on_commit=False,
+    bind=async_engine,
+    class_=AsyncSession,
+)
+
+replicas = ReplicaSet(
+    [
+        create_engine(url, connect_args=settings.pg.args, **pool_options())
+        for url in settings.pg.replica_urls
+    ],
+    retry_after=settings.pg.replica_retry_after,
+)
+async_replicas = AsyncReplicaSet(
+    [
+        create_async_engine(
+            url, connect_args=settings.pg.async_args, **pool_options(use_async=True)
+        )
+        for url in settings.pg.async_replica_urls
+    ]
+    if settings.pg.use_async
+    else [],
+    retry_after=settings.pg.replica_retry_after,
+)
 
 Base = declarative_base()
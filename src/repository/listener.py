@@ -0,0 +1,110 @@
+import contextlib
+import os
+import select
+import threading
+from typing import Callable, Optional
+
+import psycopg2
+from loguru import logger
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+
+
+class ChannelListener:
+    """Calls `callback` with the payload of every NOTIFY on `channel`.
+
+    Listens on its own connection in a daemon thread, so notifications are
+    handled as soon as they arrive. Whatever is sent while the connection is
+    down is lost, `on_connect` runs after every (re)connect to make up for it.
+    """
+
+    def __init__(
+        self,
+        dsn: str,
+        channel: str,
+        callback: Callable[[str], None],
+        on_connect: Optional[Callable[[], None]] = None,
+        connect_args: dict = {},
+        retry_after: float = 1,
+    ):
+        self.dsn = dsn
+        self.channel = channel
+        self.callback = callback
+        self.on_connect = on_connect
+        self.connect_args = connect_args
+        self.retry_after = retry_after
+
+        self.connected = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._wakeup: tuple[int, int] = (-1, -1)
+
+        self.notifications = 0
+        self.reconnects = 0
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stopped.clear()
+        self._wakeup = os.pipe()
+        self._thread = threading.Thread(
+            target=self._run, name=f"listen-{self.channel}", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._stopped.set()
+        os.write(self._wakeup[1], b"\0")
+        self._thread.join()
+        self._thread = None
+        for fd in self._wakeup:
+            os.close(fd)
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                self._listen()
+            except (psycopg2.Error, OSError) as e:
+                self.reconnects += 1
+                logger.warning(
+                    f"Listening on `{self.channel}` failed, "
+                    f"retrying in {self.retry_after}s: {e}"
+                )
+                self._stopped.wait(self.retry_after)
+            finally:
+                self.connected.clear()
+
+    def _listen(self) -> None:
+        # keepalives notice a connection that was dropped without a FIN
+        connection = psycopg2.connect(
+            self.dsn, keepalives=1, keepalives_idle=30, **self.connect_args
+        )
+        with contextlib.closing(connection):
+            connection.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+            connection.cursor().execute(f'LISTEN "{self.channel}"')
+            if self.on_connect is not None:
+                self.on_connect()
+            self.connected.set()
+
+            while not self._stopped.is_set():
+                readable, _, _ = select.select([connection, self._wakeup[0]], [], [])
+                if connection not in readable:
+                    continue
+                connection.poll()
+                while connection.notifies:
+                    self._handle(connection.notifies.pop(0).payload)
+
+    def _handle(self, payload: str) -> None:
+        self.notifications += 1
+        try:
+            self.callback(payload)
+        except Exception:
+            logger.exception(f"Failed to handle `{self.channel}` notification")
+
+    def stats(self) -> dict:
+        return {
+            "connected": self.connected.is_set(),
+            "notifications": self.notifications,
+            "reconnects": self.reconnects,
+        }
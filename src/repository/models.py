@@ -9,6 +9,7 @@ from sqlalchemy import (
     ForeignKey,
     UniqueConstraint,
     Index,
+    func,
 )
 from sqlalchemy.orm import relationship
 from pydantic import EmailStr
@@ -33,6 +34,15 @@ class User(Base):
     )
 
 
+# text_pattern_ops lets `lower(email) LIKE 'prefix%'` range scan the index
+# regardless of the database collation
+Index(
+    "users_email_lower_idx",
+    func.lower(User.email).label("email_lower"),
+    postgresql_ops={"email_lower": "text_pattern_ops"},
+)
+
+
 class SSOAuthorization(Base):
     __tablename__ = "sso_authorizations"
     __table_args__ = (
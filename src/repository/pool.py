@@ -0,0 +1,102 @@
+import time
+from threading import Lock
+from typing import Protocol, cast
+
+from loguru import logger
+from sqlalchemy import exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+
+class PoolMetrics:
+    """Checkout counters of a pool, kept across `engine.dispose()`"""
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def observe(self, seconds: float, timed_out: bool = False) -> None:
+        with self._lock:
+            self.checkouts += 1
+            self.timeouts += timed_out
+            self.wait_seconds += seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, seconds)
+
+    def stats(self) -> dict:
+        return {
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "wait_seconds": round(self.wait_seconds, 6),
+            "max_wait_seconds": round(self.max_wait_seconds, 6),
+        }
+
+
+class QueuePoolStatus(Protocol):
+    """What `pool_stats` reads off an instrumented queue pool"""
+
+    metrics: PoolMetrics
+    _max_overflow: int
+
+    def size(self) -> int:
+        ...
+
+    def checkedout(self) -> int:
+        ...
+
+    def overflow(self) -> int:
+        ...
+
+
+class InstrumentedPoolMixin:
+    """Times every checkout, including opening a new connection when it needs one"""
+
+    metrics: PoolMetrics
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            self.metrics.observe(time.perf_counter() - start, timed_out=True)
+            logger.warning(f"Connection pool exhausted: {self.status()}")
+            raise
+        self.metrics.observe(time.perf_counter() - start)
+        return connection
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+
+class InstrumentedQueuePool(InstrumentedPoolMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncQueuePool(InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def pool_stats(engine: Engine | AsyncEngine | None) -> dict:
+    if engine is None:
+        return {}
+    if not isinstance(engine.pool, InstrumentedPoolMixin):
+        return {"pool": type(engine.pool).__name__}
+    # both instrumented pools are queue pools
+    pool = cast(QueuePoolStatus, engine.pool)
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        # negative while the pool itself still has room
+        "overflow": max(pool.overflow(), 0),
+        "max_overflow": pool._max_overflow,
+        **pool.metrics.stats(),
+    }
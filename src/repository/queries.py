@@ -0,0 +1,95 @@
+import contextlib
+import time
+from contextvars import ContextVar
+from threading import Lock
+from typing import Iterator, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, raiseload
+
+from settings import settings
+
+
+class QueryStats:
+    """SQL statements run within one request and the time they took"""
+
+    def __init__(self) -> None:
+        self.statements = 0
+        self.seconds = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.statements += 1
+        self.seconds += seconds
+
+
+class QueryMetrics:
+    """Per-request statement counters of the worker"""
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self.requests = 0
+        self.statements = 0
+        self.seconds = 0.0
+        self.max_statements = 0
+
+    def observe(self, stats: QueryStats) -> None:
+        with self._lock:
+            self.requests += 1
+            self.statements += stats.statements
+            self.seconds += stats.seconds
+            self.max_statements = max(self.max_statements, stats.statements)
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "statements": self.statements,
+            "seconds": round(self.seconds, 6),
+            "max_statements": self.max_statements,
+        }
+
+
+query_metrics = QueryMetrics()
+# set for the duration of a request, copied into worker threads and greenlets
+current_stats: ContextVar[Optional[QueryStats]] = ContextVar(
+    "query_stats", default=None
+)
+
+
+@contextlib.contextmanager
+def track_queries() -> Iterator[QueryStats]:
+    stats = QueryStats()
+    token = current_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        current_stats.reset(token)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    if current_stats.get() is not None:
+        context.query_started_at = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def record_query(conn, cursor, statement, parameters, context, executemany):
+    stats = current_stats.get()
+    if stats is not None and hasattr(context, "query_started_at"):
+        stats.observe(time.perf_counter() - context.query_started_at)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def raise_on_lazy_load(orm_execute_state) -> None:
+    """With `settings.pg.raise_on_lazy_load` every relationship that isn't
+    loaded by the query itself raises instead of emitting a SELECT on access.
+    """
+    if (
+        settings.pg.raise_on_lazy_load
+        and orm_execute_state.is_select
+        and not orm_execute_state.is_column_load
+        and not orm_execute_state.is_relationship_load
+    ):
+        orm_execute_state.statement = orm_execute_state.statement.options(
+            raiseload("*", sql_only=True)
+        )
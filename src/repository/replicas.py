@@ -0,0 +1,99 @@
+import itertools
+import time
+from typing import Callable, Generic, Optional, TypeVar, Union
+
+from loguru import logger
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlalchemy.orm import Session
+
+
+EngineT = TypeVar("EngineT", bound=Union[Engine, AsyncEngine])
+
+
+class BaseReplicaSet(Generic[EngineT]):
+    """Round-robin over replica engines.
+
+    A replica that fails to connect is skipped for `retry_after` seconds, and
+    when none is reachable opening a session returns None so the caller falls
+    back to the primary.
+    """
+
+    def __init__(self, engines: list[EngineT], retry_after: float = 30):
+        self.engines = engines
+        self.retry_after = retry_after
+        self._down_until: dict[int, float] = {}
+        self._counter = itertools.count()
+
+        self.failovers = 0
+
+    def __bool__(self) -> bool:
+        return bool(self.engines)
+
+    def candidates(self) -> list[EngineT]:
+        if not self.engines:
+            return []
+        now = time.monotonic()
+        start = next(self._counter)
+        ordered = self.engines[start % len(self.engines):]
+        ordered += self.engines[:start % len(self.engines)]
+        return [
+            engine
+            for engine in ordered
+            if self._down_until.get(id(engine), 0) <= now
+        ]
+
+    def mark_down(self, engine: EngineT, error: Exception) -> None:
+        logger.warning(
+            f"Replica {engine.url.host}:{engine.url.port} is unreachable, "
+            f"skipping it for {self.retry_after}s: {error}"
+        )
+        self._down_until[id(engine)] = time.monotonic() + self.retry_after
+        self.failovers += 1
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            "replicas": len(self.engines),
+            "down": sum(until > now for until in self._down_until.values()),
+            "failovers": self.failovers,
+        }
+
+
+class ReplicaSet(BaseReplicaSet[Engine]):
+    def open_session(self, session_factory: Callable[..., Session]) -> Optional[Session]:
+        """Session on the next reachable replica.
+
+        The session checks out its connection right away and keeps it for the
+        first query, so a replica that is down is skipped without a checkout
+        of its own just to test it.
+        """
+        for engine in self.candidates():
+            session = session_factory(bind=engine)
+            try:
+                session.connection()
+                return session
+            except (SQLAlchemyError, OSError) as e:
+                session.close()
+                self.mark_down(engine, e)
+        return None
+
+
+class AsyncReplicaSet(BaseReplicaSet[AsyncEngine]):
+    async def open_session(
+        self, session_factory: Callable[..., AsyncSession]
+    ) -> Optional[AsyncSession]:
+        for engine in self.candidates():
+            session = session_factory(bind=engine)
+            try:
+                await session.connection()
+                return session
+            except (SQLAlchemyError, OSError) as e:
+                await session.close()
+                self.mark_down(engine, e)
+        return None
+
+    async def dispose_async(self) -> None:
+        for engine in self.engines:
+            await engine.dispose()
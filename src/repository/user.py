@@ -1,9 +1,34 @@
+import csv
+import io
+from functools import lru_cache, partial
 from secrets import randbelow
+from typing import Iterable, Iterator, Optional
 from datetime import datetime, timedelta
 
+import anyio
+from sqlalchemy import (
+    String,
+    bindparam,
+    cast,
+    delete,
+    exists,
+    func,
+    insert,
+    literal,
+    literal_column,
+    select,
+    true,
+    union_all,
+    update,
+)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.engine import Row
+from sqlalchemy.orm import joinedload
+from sqlalchemy.sql import Select
+
 from repository.models import User, SSOAuthorization, VerificationCode
 
-from .base import ABCReposotory
+from .base import ABCAsyncRepository, ABCReposotory
 
 
 def generate_verification_code() -> int:
@@ -11,64 +36,239 @@ def generate_verification_code() -> int:
     return randbelow(900000) + 100000
 
 
+# xmin changes with every update of the row, so it serves as its version
+USER_VERSION = literal_column("users.xmin::text").label("version")
+
+
+def user_column(field: str):
+    if field == "version":
+        return USER_VERSION
+    return getattr(User, field)
+
+
+def select_fields(fields: Iterable[str]) -> Select:
+    """Select only `fields` of users, returned as plain rows instead of entities.
+
+    Besides model columns `fields` may contain "version" - the row version.
+    """
+    return select(*(user_column(field) for field in fields)).select_from(User)
+
+
+# Hot lookups are built once and executed with new parameters, which saves
+# building the statement and its compiled-cache key on every call
+GET_BY_ID = select(User).where(User.id == bindparam("id"))
+GET_BY_EMAIL = select(User).where(User.email == bindparam("email"))
+# the user is joined in as using the code marks them verified
+GET_VERIFICATION_CODE = (
+    select(VerificationCode)
+    .options(joinedload(VerificationCode.user))
+    .where(
+        VerificationCode.user_id == bindparam("user_id"),
+        VerificationCode.code == bindparam("code"),
+    )
+)
+
+
+def build_sso_upsert():
+    """One statement that finds the user linked to an SSO account or creates both.
+
+    Returns no row when the email belongs to an account that isn't linked, or
+    when a concurrent first login for the same account committed after the
+    statement started. Running it again tells those apart.
+    """
+    users, sso = User.__table__, SSOAuthorization.__table__
+    email = cast(bindparam("email"), String)
+    provider_name = cast(bindparam("provider_name"), String)
+    provider_id = cast(bindparam("provider_id"), String)
+
+    linked = (
+        select(users)
+        .join(sso, sso.c.user_id == users.c.id)
+        .where(
+            sso.c.provider_name == provider_name,
+            sso.c.provider_id == provider_id,
+            users.c.email == email,
+        )
+        .cte("linked")
+    )
+    # skipping the insert for known accounts doesn't burn a sequence value
+    new_user = (
+        pg_insert(users)
+        .from_select(
+            ["email", "password", "is_active", "is_email_verified"],
+            select(email, literal(""), true(), true()).where(~exists(linked.select())),
+        )
+        .on_conflict_do_nothing(index_elements=[users.c.email])
+        .returning(*users.c)
+        .cte("new_user")
+    )
+    new_sso = (
+        insert(sso)
+        .from_select(
+            ["provider_name", "provider_id", "user_id"],
+            select(provider_name, provider_id, new_user.c.id),
+        )
+        .cte("new_sso")
+    )
+    return select(User).from_statement(
+        union_all(select(linked), select(new_user)).add_cte(new_sso)
+    )
+
+
+UPSERT_BY_SSO_PROVIDER = build_sso_upsert()
+
+
+@lru_cache(maxsize=64)
+def select_row_by_id(fields: tuple[str, ...]) -> Select:
+    return select_fields(fields).where(User.id == bindparam("id"))
+
+
+def escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def select_by_email_prefix(
+    prefix: str, filters: dict, limit: int, fields: list[str]
+) -> Select:
+    """Users whose email starts with `prefix`, case-insensitively.
+
+    Ordered by the lowered email so it is served by `users_email_lower_idx`.
+    """
+    email = func.lower(User.email)
+    return (
+        select_fields(fields)
+        .filter_by(**filters)
+        .filter(email.like(f"{escape_like(prefix.lower())}%", escape="\\"))
+        .order_by(email)
+        .limit(limit)
+    )
+
+
 class UserRepository(ABCReposotory):
+    """Writes are only flushed, committing is up to the domain's unit of work"""
+
     def get_by_id(self, id: int) -> User:
-        return self.session.query(User).filter_by(id=id).one()
+        return self.session.execute(GET_BY_ID, {"id": id}).scalar_one()
 
-    def get_by_email(self, email: str) -> User:
-        return self.session.query(User).filter_by(email=email).one()
+    def get_row_by_id(self, id: int, fields: list[str]) -> Row:
+        statement = select_row_by_id(tuple(fields))
+        return self.session.execute(statement, {"id": id}).one()
 
-    def get_by_sso_provider(
-        self, provider_name: str, provider_id: str, email: str
-    ) -> tuple[User, SSOAuthorization]:
-        return (
-            self.session.query(User, SSOAuthorization)
-            .filter(
-                SSOAuthorization.provider_name == provider_name,
-                SSOAuthorization.provider_id == provider_id,
-                User.email == email,
-                User.id == SSOAuthorization.user_id,
-            )
-            .one()
-        )
+    def get_by_email(self, email: str) -> User:
+        return self.session.execute(GET_BY_EMAIL, {"email": email}).scalar_one()
 
-    def fetch(self, filters: dict = {}, offset: int = 0, limit: int = 0) -> list[User]:
-        return (
-            self.session.query(User)
+    def fetch_rows(
+        self, filters: dict, offset: int, limit: int, fields: list[str]
+    ) -> list[Row]:
+        statement = (
+            select_fields(fields)
             .filter_by(**filters)
+            .order_by(User.id)
             .offset(offset)
             .limit(limit)
-            .all()
         )
+        return self.session.execute(statement).all()
+
+    def fetch_rows_after(
+        self, filters: dict, after_id: Optional[int], limit: int, fields: list[str]
+    ) -> list[Row]:
+        statement = select_fields(fields).filter_by(**filters)
+        if after_id is not None:
+            statement = statement.filter(User.id > after_id)
+        return self.session.execute(statement.order_by(User.id).limit(limit)).all()
+
+    def search_rows(
+        self, email_prefix: str, filters: dict, limit: int, fields: list[str]
+    ) -> list[Row]:
+        statement = select_by_email_prefix(email_prefix, filters, limit, fields)
+        return self.session.execute(statement).all()
+
+    def stream(
+        self, filters: dict = {}, fields: list[str] = ["id"], batch_size: int = 1000
+    ) -> Iterator[list[Row]]:
+        """Yield batches of plain rows with `fields` through a server-side cursor.
+
+        No ORM objects are built and at most one batch is held in memory.
+        """
+        statement = (
+            select_fields(fields)
+            .filter_by(**filters)
+            .order_by(User.id)
+            .execution_options(stream_results=True, max_row_buffer=batch_size)
+        )
+        yield from self.session.execute(statement).partitions(batch_size)
+
+    def count(self, filters: dict = {}) -> int:
+        return self.session.query(func.count(User.id)).filter_by(**filters).scalar()
+
+    def estimate_count(self, filters: dict = {}) -> int:
+        """Row count the PostgreSQL planner expects, from table statistics"""
+        statement = self.session.query(User.id).filter_by(**filters).statement
+        compiled = statement.compile(dialect=self.session.get_bind().dialect)
+        plan = (
+            self.session.connection()
+            .exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled}", compiled.params)
+            .scalar_one()
+        )
+        return int(plan[0]["Plan"]["Plan Rows"])
 
     def create_user(self, user: User) -> User:
         self.session.add(user)
-        self.session.commit()
+        self.session.flush()
         return user
 
-    def create_user_by_sso_provider(
+    def upsert_user_by_sso_provider(
         self, provider_name: str, provider_id: str, email: str
-    ) -> tuple[User, SSOAuthorization]:
-        user = User(email=email, password="", is_email_verified=True)  # type: ignore
-        sso_auth = SSOAuthorization(
-            provider_id=provider_id, provider_name=provider_name, user=user
+    ) -> Optional[User]:
+        parameters = {
+            "provider_name": provider_name,
+            "provider_id": provider_id,
+            "email": email,
+        }
+        return self.session.execute(UPSERT_BY_SSO_PROVIDER, parameters).scalar()
+
+    def existing_emails(self, emails: list[str]) -> set[str]:
+        statement = select(User.email).where(User.email.in_(emails))
+        return set(self.session.execute(statement).scalars())
+
+    def copy_users(self, users: list[tuple[str, str, bool, bool]]) -> set[str]:
+        """Bulk insert `(email, password, is_active, is_email_verified)` rows.
+
+        Rows are COPYed into a temporary table and moved over in one INSERT
+        that skips emails already taken, so duplicates don't abort the batch.
+        Returns emails that were inserted.
+        """
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(users)
+        buffer.seek(0)
+
+        # COPY is only exposed by the driver connection
+        cursor = self.session.connection().connection.cursor()
+        cursor.execute(
+            "CREATE TEMPORARY TABLE users_import "
+            "(LIKE users INCLUDING DEFAULTS) ON COMMIT DROP"
+        )
+        cursor.copy_expert(
+            "COPY users_import (email, password, is_active, is_email_verified) "
+            "FROM STDIN WITH (FORMAT csv)",
+            buffer,
         )
+        cursor.execute(
+            "INSERT INTO users (email, password, is_active, is_email_verified) "
+            "SELECT email, password, is_active, is_email_verified FROM users_import "
+            "ON CONFLICT (email) DO NOTHING RETURNING email"
+        )
+        return {email for email, in cursor.fetchall()}
 
-        self.session.add(user)
-        self.session.add(sso_auth)
-        self.session.commit()
-        return user, sso_auth
+    def update_password(self, user_id: int, password: str) -> None:
+        self.session.query(User).filter_by(id=user_id).update({"password": password})
 
     def delete_user(self, user_id: int) -> None:
         self.session.query(User).filter_by(id=user_id).delete()
-        self.session.commit()
 
     def get_verification_code(self, user_id: int, code: int) -> VerificationCode:
-        return (
-            self.session.query(VerificationCode)
-            .filter_by(user_id=user_id, code=code)
-            .one()
-        )
+        parameters = {"user_id": user_id, "code": code}
+        return self.session.execute(GET_VERIFICATION_CODE, parameters).scalar_one()
 
     def create_verification_code(
         self, user: User, expires_at: timedelta
@@ -79,7 +279,6 @@ class UserRepository(ABCReposotory):
             expires_at=datetime.now() + expires_at,
         )
         self.session.add(db_code)
-        self.session.commit()
         return db_code
 
     def use_verification_code(self, code: VerificationCode) -> User:
@@ -87,5 +286,87 @@ class UserRepository(ABCReposotory):
         user.is_email_verified = True
         self.session.add(user)
         self.session.delete(code)
-        self.session.commit()
         return user
+
+
+class AsyncUserRepository(ABCAsyncRepository):
+    """`UserRepository` on top of `AsyncSession`"""
+
+    async def get_by_id(self, id: int) -> User:
+        result = await self.session.execute(GET_BY_ID, {"id": id})
+        return result.scalar_one()
+
+    async def get_row_by_id(self, id: int, fields: list[str]) -> Row:
+        statement = select_row_by_id(tuple(fields))
+        result = await self.session.execute(statement, {"id": id})
+        return result.one()
+
+    async def get_by_email(self, email: str) -> User:
+        result = await self.session.execute(GET_BY_EMAIL, {"email": email})
+        return result.scalar_one()
+
+    async def create_user(self, user: User) -> User:
+        self.session.add(user)
+        await self.session.flush()
+        return user
+
+    async def upsert_user_by_sso_provider(
+        self, provider_name: str, provider_id: str, email: str
+    ) -> Optional[User]:
+        parameters = {
+            "provider_name": provider_name,
+            "provider_id": provider_id,
+            "email": email,
+        }
+        result = await self.session.execute(UPSERT_BY_SSO_PROVIDER, parameters)
+        return result.scalar()
+
+    async def update_password(self, user_id: int, password: str) -> None:
+        await self.session.execute(
+            update(User).filter_by(id=user_id).values(password=password)
+        )
+
+    async def delete_user(self, user_id: int) -> None:
+        await self.session.execute(delete(User).filter_by(id=user_id))
+
+    async def get_verification_code(self, user_id: int, code: int) -> VerificationCode:
+        parameters = {"user_id": user_id, "code": code}
+        result = await self.session.execute(GET_VERIFICATION_CODE, parameters)
+        return result.scalar_one()
+
+    async def create_verification_code(
+        self, user: User, expires_at: timedelta
+    ) -> VerificationCode:
+        db_code = VerificationCode(
+            user_id=user.id,
+            code=generate_verification_code(),
+            expires_at=datetime.now() + expires_at,
+        )
+        self.session.add(db_code)
+        return db_code
+
+    async def use_verification_code(self, code: VerificationCode) -> User:
+        user = code.user
+        user.is_email_verified = True
+        self.session.add(user)
+        await self.session.delete(code)
+        return user
+
+
+class ThreadedUserRepository:
+    """Awaitable facade over the sync `UserRepository`.
+
+    Every call runs in the worker threadpool, so the psycopg2 driver never blocks
+    the event loop. Used by the async domain when `settings.pg.use_async` is off.
+    """
+
+    def __init__(self, repository: UserRepository) -> None:
+        self.repository = repository
+
+    def __getattr__(self, name: str):
+        method = getattr(self.repository, name)
+
+        async def call(*args, **kwargs):
+            return await anyio.to_thread.run_sync(partial(method, *args, **kwargs))
+
+        return call
@@ -1,5 +1,7 @@
+from typing import Optional
+
 from . import ORMBaseModel
-from .user import PublicUserSchema, UserInDbSchema
+from .user import PublicUserSchema, UserSchema
 
 
 class TokenSchema(ORMBaseModel):
@@ -10,6 +12,7 @@ class TokenSchema(ORMBaseModel):
 class TokenDataSchema(ORMBaseModel):
     sub: str
     exp: int
+    iat: Optional[int] = None
     scopes: list[str] = []
 
 
@@ -20,7 +23,7 @@ class RefreshTokenSchema(ORMBaseModel):
 class AuthenticatedUserSchema(ORMBaseModel):
     """used in dependency for authenticated users"""
 
-    user: UserInDbSchema
+    user: UserSchema
     token_payload: dict
 
 
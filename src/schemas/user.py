@@ -1,25 +1,37 @@
+from typing import Optional
+
 from pydantic import validator, EmailStr
 
 from . import ORMBaseModel
 
 
-class UserInDbSchema(ORMBaseModel):
+class UserSchema(ORMBaseModel):
     id: int
     email: EmailStr
-    password: str
     is_active: bool
     is_email_verified: bool
 
 
+class UserInDbSchema(UserSchema):
+    password: str
+
+
+USER_FIELDS = list(UserSchema.__fields__)
+
+
 class PublicUserSchema(ORMBaseModel):
     id: str
     email: EmailStr
     is_email_verified: bool
 
 
+PUBLIC_USER_FIELDS = list(PublicUserSchema.__fields__)
+
+
 class PaginatedUserSchema(ORMBaseModel):
     count: int
     items: list[PublicUserSchema]
+    next_cursor: Optional[str] = None
 
 
 class UserToCreateSchema(ORMBaseModel):
@@ -36,3 +48,21 @@ class UserToCreateSchema(ORMBaseModel):
         if len(value) < 8:
             raise ValueError("Password must be at least 8 characters long")
         return value
+
+
+class UserToImportSchema(UserToCreateSchema):
+    is_active: bool = True
+    is_email_verified: bool = False
+
+
+class InvalidImportRecordSchema(ORMBaseModel):
+    line: int
+    error: str
+
+
+class UserImportReportSchema(ORMBaseModel):
+    created: int = 0
+    duplicates: list[str] = []
+    invalid: list[InvalidImportRecordSchema] = []
+    seconds: float = 0
+    rows_per_second: float = 0